@@ -24,13 +24,29 @@ class Module:
             return 0.0
         return 1.0 / self.total_conductance
 
+def latest_rows(rows: List[tuple], status_idx: int) -> List[tuple]:
+    """Keep each serial's current row: its last one, unless a "superseded" row followed it."""
+    latest = {}
+    for i, row in rows:
+        if not row:
+            continue
+        if len(row) > status_idx and row[status_idx] == "superseded":
+            latest.pop(row[0], None)
+        else:
+            latest[row[0]] = (i, row)
+    return sorted(latest.values(), key=lambda item: item[0])
+
 def read_cells(file_path: str) -> List[Cell]:
     cells = []
     try:
         with open(file_path, mode='r', newline='', encoding='utf-8-sig') as f:
             reader = csv.reader(f)
             header = next(reader, None) # Skip header
-            for i, row in enumerate(reader):
+            rows = enumerate(reader)
+            if header and "Status" in header:
+                # Retested cells: drop the results they replaced
+                rows = latest_rows(list(rows), header.index("Status"))
+            for i, row in rows:
                 if not row or len(row) < 6:
                     continue
                 
@@ -22,30 +22,84 @@ Usage:
     python test_cells.py output.csv --mock  # For testing without hardware
 """
 
+from __future__ import annotations
+
 import argparse
+import asyncio
+import atexit
 import csv
+import functools
+import json
+import os
+import queue
+import re
+import select
+import shutil
+import stat
+import tempfile
+import threading
 import time
 import sys
 import string
+from typing import TYPE_CHECKING, NamedTuple, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
 
 # =============================================================================
 # Dependency Validation
 # =============================================================================
-# Check for required packages before proceeding. This provides a clear error
-# message if dependencies are missing, rather than failing mid-execution.
-
-try:
-    import pyvisa
-except ImportError:
-    print("\n" + "=" * 60)
-    print("ERROR: Missing required dependency 'pyvisa'")
-    print("=" * 60)
-    print("\nInstall it using:")
-    print("    pip install pyvisa pyvisa-py")
-    print("\nFor USB support, you may also need:")
-    print("    pip install pyusb")
-    print("=" * 60)
-    sys.exit(1)
+# PyVISA is only needed to talk to real hardware and NumPy only for the
+# waveform analysis, so neither is imported at module load: the CSV helpers
+# work without them, and --mock runs without PyVISA.
+
+@functools.lru_cache(maxsize=None)
+def _import_pyvisa():
+    """
+    Import PyVISA, exiting with installation instructions if it is missing.
+    
+    Returns:
+        The pyvisa module
+    """
+    try:
+        import pyvisa
+    except ImportError:
+        print("\n" + "=" * 60)
+        print("ERROR: Missing required dependency 'pyvisa'")
+        print("=" * 60)
+        print("\nInstall it using:")
+        print("    pip install pyvisa pyvisa-py")
+        print("\nFor USB support, you may also need:")
+        print("    pip install pyusb")
+        print("=" * 60)
+        sys.exit(1)
+    return pyvisa
+
+
+@functools.lru_cache(maxsize=None)
+def _import_numpy():
+    """
+    Import NumPy, exiting with installation instructions if it is missing.
+    
+    Called once at startup, since every cell's analysis needs it, so a
+    missing install is reported before testing rather than as each cell
+    failing.
+    
+    Returns:
+        The numpy module
+    """
+    try:
+        import numpy
+    except ImportError:
+        print("\n" + "=" * 60)
+        print("ERROR: Missing required dependency 'numpy'")
+        print("=" * 60)
+        print("\nInstall it using:")
+        print("    pip install numpy")
+        print("=" * 60)
+        sys.exit(1)
+    return numpy
+
 
 # =============================================================================
 # Instrument Configuration
@@ -56,6 +110,9 @@ except ImportError:
 
 RESOURCE_NAME = "USBn::0x5E6::0x2461::04628946::INSTR"
 
+# How often to check the instrument still responds while waiting for a scan
+kHealthPollInterval_seconds = 5.0
+
 # =============================================================================
 # Test Parameters
 # =============================================================================
@@ -69,13 +126,194 @@ kDischargeComplianceLimit_volts = 2.5   # Minimum voltage during discharging
 # R0 (instantaneous resistance) test parameters
 kR0PulseCurrent_amps = 1.0              # Pulse current magnitude [A]
 kR0PulseDuration_seconds = 0.0025       # Pulse width [s] (2.5ms)
+kR0OnsetSettle_seconds = 50e-6          # Current rise skipped before the fit [s]
+kR0OnsetWindow_seconds = 100e-6         # Pulse start fitted for instant R0 [s]
+kR0ReuseIdleVoltage = False             # Skip the pre-discharge V_idle reading
+
+# Digitizer sample rate used during current pulses
+kDigitizerSampleRate_hz = 500000
 
 # DCIR (DC internal resistance) test parameters
 kDcirCurrent_amps = 1                   # DC test current magnitude [A]
 kDcirDuration_seconds = 5.0             # Current application duration [s]
+kDcirTracePoints = 50                   # Voltage readings logged during load
+kDcirTraceNplc = 1                      # Integration time per reading [PLC]
+kDcirLoadAveragePoints = 5              # Final readings averaged for V_load
 
 # Measurement settling time
 kVoltageSenseDwell_seconds = 0.1        # Wait time before voltage reading [s]
+kIdleReuseMaxAge_seconds = 2.0          # Max age of OCV reused as R0 V_idle [s]
+
+
+@functools.lru_cache(maxsize=None)
+def _plateau_mean_kernel():
+    """
+    Compile the trimmed plateau mean with Numba, if it is installed.
+    
+    The kernel computes the same value as Keithley2461._plateau_mean: the
+    central 50% of samples in time, with the lowest and highest quarter of
+    values dropped, as an explicit loop that Numba turns into native code.
+    
+    Returns:
+        The compiled kernel, or None when Numba is not available
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    
+    def kernel(samples, scratch):
+        n = samples.size
+        start_idx = n // 4
+        end_idx = max(start_idx + 1, (3 * n) // 4)
+        
+        m = end_idx - start_idx
+        plateau = scratch[:m]
+        plateau[:] = samples[start_idx:end_idx]
+        plateau.sort()
+        
+        k = m // 4
+        total = 0.0
+        for i in range(k, m - k):
+            total += plateau[i]
+        return total / (m - 2 * k)
+    
+    return njit(cache=True, fastmath=True)(kernel)
+
+
+class VoltageReading(NamedTuple):
+    """
+    A single voltage reading and when it was taken.
+    
+    Attributes:
+        voltage: Measured voltage in volts
+        timestamp: time.monotonic() value taken as the reading returned
+    """
+    voltage: float
+    timestamp: float
+
+
+class PulseCapture(NamedTuple):
+    """
+    Result of a digitized current pulse.
+    
+    Attributes:
+        plateau_mean: Trimmed mean voltage over the pulse plateau in volts
+        samples: Every digitized voltage sample, one per 1/kDigitizerSampleRate_hz
+            seconds from the start of the pulse (None in mock mode)
+    """
+    plateau_mean: float
+    samples: np.ndarray | None
+
+
+class VoltageTrace(NamedTuple):
+    """
+    Voltage readings logged in the instrument's buffer over a time window.
+    
+    Attributes:
+        time: Reading timestamps in seconds, relative to the first reading
+        voltage: Measured voltages in volts
+        step_delay: Time from the load current step to the first reading in
+            seconds (0 if not known)
+    """
+    time: Sequence[float]
+    voltage: Sequence[float]
+    step_delay: float = 0.0
+
+
+class DcirFit(NamedTuple):
+    """
+    Polarization model fitted to a DCIR load trace (see analyze_dcir_trace).
+    
+    Attributes:
+        r_ohm: Ohmic resistance (fitted step at the current step) in ohms
+        r_ct: Charge-transfer resistance in ohms
+        tau: Charge-transfer time constant in seconds
+        sigma: Warburg coefficient in ohms per root second
+    """
+    r_ohm: float
+    r_ct: float
+    tau: float
+    sigma: float
+
+
+class R0Result(NamedTuple):
+    """
+    Result of the R0 pulse test (see test_r0).
+    
+    Attributes:
+        r0: Average R0 (charge + discharge) in ohms
+        r0_charge: Charging direction R0 in ohms
+        r0_discharge: Discharging direction R0 in ohms
+        r0_instant: Average instantaneous R0 in ohms
+        r0_instant_charge: Charging direction instantaneous R0 in ohms
+        r0_instant_discharge: Discharging direction instantaneous R0 in ohms
+    """
+    r0: float
+    r0_charge: float
+    r0_discharge: float
+    r0_instant: float
+    r0_instant_charge: float
+    r0_instant_discharge: float
+
+
+class DcirResult(NamedTuple):
+    """
+    Result of the DCIR test (see test_dcir).
+    
+    Attributes:
+        dcir: Average DCIR (charge + discharge) in ohms
+        dcir_charge: Charging direction DCIR in ohms
+        dcir_discharge: Discharging direction DCIR in ohms
+        fit: Polarization model fitted to the load traces, averaged over
+            both directions
+        trace_charge: Voltage logged during the charge load
+        trace_discharge: Voltage logged during the discharge load
+    """
+    dcir: float
+    dcir_charge: float
+    dcir_discharge: float
+    fit: DcirFit
+    trace_charge: VoltageTrace
+    trace_discharge: VoltageTrace
+
+
+class CellResult(NamedTuple):
+    """
+    All test results for one cell.
+    
+    Attributes:
+        serial_number: Cell identification string
+        ocv: Open circuit voltage in volts
+        r0: R0 pulse test result
+        dcir: DCIR test result
+    """
+    serial_number: str
+    ocv: float
+    r0: R0Result
+    dcir: DcirResult
+    
+    def as_row(self) -> dict:
+        """
+        Flatten the result into a CSV row keyed by FIELDNAMES.
+        
+        Returns:
+            Dictionary of every column except Status
+        """
+        return {
+            "Serial Number": self.serial_number,
+            "OCV (V)": self.ocv,
+            "R0 (Ohm)": self.r0.r0,
+            "R0 Charge (Ohm)": self.r0.r0_charge,
+            "R0 Discharge (Ohm)": self.r0.r0_discharge,
+            "DCIR (Ohm)": self.dcir.dcir,
+            "DCIR Charge (Ohm)": self.dcir.dcir_charge,
+            "DCIR Discharge (Ohm)": self.dcir.dcir_discharge,
+            "DCIR Ohmic (Ohm)": self.dcir.fit.r_ohm,
+            "DCIR Rct (Ohm)": self.dcir.fit.r_ct,
+            "DCIR Tau (s)": self.dcir.fit.tau,
+            "DCIR Warburg (Ohm/s^0.5)": self.dcir.fit.sigma,
+        }
 
 
 class Keithley2461:
@@ -83,12 +321,12 @@ class Keithley2461:
     Driver class for Keithley 2461 SourceMeter Unit.
     
     Provides high-level methods for battery cell testing including voltage/current
-    measurement, DC sourcing, and pulsed current operations. Supports both real
-    hardware and mock mode for development/testing.
+    measurement, DC sourcing, and pulsed current operations. For development
+    without hardware, use MockKeithley2461 (or make_smu(..., mock=True)).
     
     Attributes:
-        mock (bool): If True, simulates instrument responses without hardware.
-        inst: PyVISA instrument resource (None if mock=True).
+        mock (bool): False for real hardware; True on MockKeithley2461.
+        inst: PyVISA instrument resource (None on MockKeithley2461).
     
     Example:
         >>> smu = Keithley2461("USB0::0x05E6::0x2461::04628946::INSTR")
@@ -96,59 +334,147 @@ class Keithley2461:
         >>> voltage = smu.measure_voltage()
         >>> smu.close()
     """
+
+    # Bytes removed by _clean_string. Everything in string.printable is ASCII,
+    # so only the ASCII control characters need listing; anything above 0x7F
+    # is dropped by the ASCII encode step instead.
+    _NON_PRINTABLE_BYTES = bytes(
+        i for i in range(128) if chr(i) not in string.printable
+    )
+
+    # *IDN? reply: manufacturer, model, serial number, firmware version
+    _IDN_PATTERN = re.compile(r"([^,]+),([^,]+),([^,]+),(.+)")
+
+    # Configuration applied once at connection time, sent as a single
+    # compound SCPI line after the reset.
+    _INIT_COMMANDS = (
+        # Enable 4-wire (Kelvin) sensing for accurate low-resistance
+        # measurements. This eliminates lead resistance from the measurement
+        ":SENS:VOLT:RSEN ON",
+        # Use front panel terminals for this setup.
+        ":ROUT:TERM FRONT",
+        # Configure as current source with voltage measurement
+        ":SOUR:FUNC CURR",
+        # Enable auto-ranging for flexibility across different cell types
+        ":SOUR:CURR:RANG:AUTO ON",
+        ":SENS:VOLT:RANG:AUTO ON",
+        ":SENS:CURR:RANG:AUTO ON",
+        # Enable output (required for 4-wire sensing to function)
+        ":OUTP ON",
+    )
+
+    # Source and digitizer configuration issued before every current pulse.
+    # None of these depend on the pulse parameters, so they are sent as one
+    # compound (';'-joined) SCPI line.
+    _PULSE_SETUP_COMMANDS = (
+        ":SOURce:FUNC CURRent",                 # Current output...
+        ":SOURce:CURRent:READ:BACK ON",         # ...with readback
+        ':DIGitize:FUNC "VOLTage"',             # Digitize voltage
+        ":DIGitize:VOLTage:RSENse ON",          # Use 4-wire sensing
+        ":DIGitize:VOLTage:RANGe 10",           # 10V range for Li-ion
+        # 500kS/s sample rate
+        f":DIGitize:VOLTage:SRATe {kDigitizerSampleRate_hz}",
+    )
     
-    def __init__(self, resource_name: str, mock: bool = False):
+    # Complete pulse configuration line: the setup above, a command that
+    # sizes or clears the buffer, and the pulse train, whose arguments are
+    # bias, level, width, count, measure, buffer, delay, off_time,
+    # bias_limit, pulse_limit, fail_abort
+    _PULSE_COMMAND_TEMPLATE = ";".join(_PULSE_SETUP_COMMANDS + (
+        '{buffer_command}',
+        ':SOURce:PULSe:TRain:CURRent {bias}, {level}, {width}, {count}, '
+        '{measure}, "defbuffer1", {delay}, {off_time}, {bias_limit}, '
+        '{pulse_limit}, 0',
+    ))
+    
+    # Read size for :TRACe:DATA? transfers. A full 100k-point buffer is
+    # ~400 KB, so it arrives in one read instead of several; other queries
+    # keep the smaller default so short replies don't get a 1 MB read buffer
+    _BUFFER_READ_CHUNK_SIZE = 1024 * 1024
+    
+    mock = False
+    
+    def __init__(self, resource_name: str):
         """
         Initialize connection to the Keithley 2461.
         
         Args:
             resource_name: VISA resource string (e.g., "USB0::0x05E6::...::INSTR")
-            mock: If True, operate in simulation mode without hardware
         
         Raises:
             pyvisa.errors.VisaIOError: If connection to instrument fails
+            RuntimeError: If the instrument rejects the initial configuration
         """
-        self.mock = mock
         self.inst = None
+
+        # Encoded SCPI commands memoized by _write_cached
+        self._scpi_cache: dict[tuple, bytes] = {}
+
+        # Source/sense configuration currently programmed on the instrument,
+        # so source_current only writes settings that actually change.
+        # Matches _INIT_COMMANDS; the sense function and source level
+        # (current, voltage limit) are not known yet.
+        self._src_state = {
+            'func': 'CURR', 'sense': None, 'rsen': True, 'range_auto': True,
+            'level': None
+        }
+        
+        pyvisa = _import_pyvisa()
+        np = _import_numpy()
+        
+        # Work buffer for pulse plateau processing, reused across pulses so
+        # each R0 measurement doesn't allocate (and later free) a fresh array
+        self._pulse_buf = np.empty(100_000, dtype=np.float64)
         
-        if self.mock:
-            print(f"[MOCK MODE] Simulating connection to {resource_name}")
-            return
+        # Size of the "dcirbuf" reading buffer (None until first created) and
+        # the mains frequency, which sets the duration of one PLC
+        self._trace_points = None
+        self._line_freq = None
+        self._trace_deadline = 0.0
+        
+        # Two (time, voltage) rows per slot; the slots alternate between
+        # fetches so a cell's charge and discharge traces can coexist
+        self._trace_bufs = [np.empty((2, kDcirTracePoints), dtype=np.float64)
+                            for _ in range(2)]
+        self._trace_slot = 0
+        
+        # Current size of "defbuffer1" as set for pulses (None: not set yet)
+        self._pulse_points = None
+        
+        # Parsed *IDN? reply, filled in by the first identify() call
+        self._idn = None
         
         print(f"[INIT] Connecting to Keithley 2461...")
-        print(f"       Resource: {RESOURCE_NAME}")
+        print(f"       Resource: {resource_name}")
         
         # Initialize PyVISA with the pure-Python backend (works without NI-VISA)
-        rm = pyvisa.ResourceManager('@py')
-        self.inst = rm.open_resource(RESOURCE_NAME)
+        # The resource manager is kept for the life of the session: dropping
+        # it lets pyvisa-py tear down its USB backend state under the session
+        self._rm = pyvisa.ResourceManager('@py')
+        self.inst = self._rm.open_resource(resource_name)
         
         # Configure serial communication parameters
         self.inst.timeout = 5000          # 5 second timeout for commands
         self.inst.write_termination = '\n'
         self.inst.read_termination = '\n'
         
-        # Reset instrument to known state and clear any pending errors
-        self.inst.write("*RST")
-        self.inst.write("*CLS")
+        # Read in 64 KB chunks (default is 20 KB); buffer readouts use
+        # larger chunks still (see _query_buffer)
+        self.inst.chunk_size = 65536
         
-        # Enable 4-wire (Kelvin) sensing for accurate low-resistance measurements
-        # This eliminates lead resistance from the measurement
-        self.inst.write(":SENS:VOLT:RSEN ON")
+        # Over LAN, send small SCPI writes immediately instead of letting
+        # Nagle's algorithm hold them back waiting for more data
+        if self.inst.interface_type == pyvisa.constants.InterfaceType.tcpip:
+            self.inst.set_visa_attribute(
+                pyvisa.constants.ResourceAttribute.tcpip_nodelay, True
+            )
         
-        # Use front panel terminals for this setup.
-        self.inst.write(":ROUTe:TERMinals FRONT")
+        # Reset to a known state, clear pending errors and apply the whole
+        # configuration in one USB transaction, then check the error queue
+        # once instead of after every command
+        self.inst.write(";".join(("*RST", "*CLS") + self._INIT_COMMANDS))
         print("       Terminals: FRONT")
-        
-        # Configure as current source with voltage measurement
-        self.inst.write(":SOURce:FUNCtion CURRent")
-        
-        # Enable auto-ranging for flexibility across different cell types
-        self.inst.write(":SOURce:CURR:RANGe:AUTO ON")
-        self.inst.write(":SENS:VOLT:RANGe:AUTO ON")
-        self.inst.write(":SENS:CURR:RANGe:AUTO ON")
-        
-        # Enable output (required for 4-wire sensing to function)
-        self.inst.write(":OUTPut:STATe ON")
+        self._check_errors("configuration")
         
         print("[INIT] Instrument configured successfully")
 
@@ -166,7 +492,10 @@ class Keithley2461:
         Returns:
             String containing only printable ASCII characters
         """
-        return "".join(char for char in input_string if char in string.printable)
+        ascii_only = input_string.encode('ascii', 'ignore')
+        return ascii_only.translate(
+            None, Keithley2461._NON_PRINTABLE_BYTES
+        ).decode('ascii')
 
     @staticmethod
     def _parse_reading(input_string: str) -> dict:
@@ -176,6 +505,10 @@ class Keithley2461:
         The Keithley returns readings in the format:
         voltage, current, resistance, timestamp, status
         
+        Responses are normally clean ASCII, which float() accepts directly
+        (it ignores surrounding whitespace), so the character filter in
+        _clean_string is only applied if that first attempt fails.
+        
         Args:
             input_string: Raw comma-separated response from :MEAS? query
             
@@ -185,8 +518,7 @@ class Keithley2461:
         Raises:
             ValueError: If response cannot be parsed (wrong format/field count)
         """
-        cleaned = Keithley2461._clean_string(input_string)
-        fields = cleaned.split(',')
+        fields = input_string.strip().split(',')
         
         if len(fields) < 5:
             raise ValueError(
@@ -194,13 +526,134 @@ class Keithley2461:
                 f"Raw response: {input_string!r}"
             )
         
-        return {
-            'voltage': float(fields[0]),
-            'current': float(fields[1]),
-            'resistance': float(fields[2]),
-            'time': float(fields[3]),
-            'status': float(fields[4])
-        }
+        try:
+            v, c, r, t, st = map(float, fields[:5])
+        except ValueError:
+            # Stray control characters in the response; filter and retry
+            fields = Keithley2461._clean_string(input_string).split(',')
+            v, c, r, t, st = map(float, fields[:5])
+        
+        return {'voltage': v, 'current': c, 'resistance': r, 'time': t, 'status': st}
+
+    def _check_errors(self, context: str):
+        """
+        Read the instrument error queue and raise if it is not empty.
+        
+        Compound SCPI lines do not report which command failed, so this is
+        called once after a batch of writes rather than per command.
+        
+        Args:
+            context: Short description of the operation, used in the message
+            
+        Raises:
+            RuntimeError: If the instrument reports an error
+        """
+        response = self.inst.query(":SYST:ERR?").strip()
+        code = response.split(',', 1)[0]
+        if int(code) != 0:
+            raise RuntimeError(
+                f"Instrument reported an error during {context}: {response}"
+            )
+
+    def _write_cached(self, key: tuple, builder) -> None:
+        """
+        Write a SCPI command whose encoded text is memoized under a key.
+        
+        The command is formatted and encoded (with the write termination) the
+        first time a key is seen; later calls send the cached bytes directly.
+        
+        Args:
+            key: Hashable identifier, including any parameters in the command
+            builder: Zero-argument callable returning the SCPI command string
+        """
+        cmd = self._scpi_cache.get(key)
+        if cmd is None:
+            cmd = (builder() + self.inst.write_termination).encode('ascii')
+            self._scpi_cache[key] = cmd
+        self.inst.write_raw(cmd)
+
+    def _query_buffer(self, query: str) -> np.ndarray:
+        """
+        Read reading-buffer contents as a float32 NumPy array.
+        
+        Data is transferred as IEEE-754 single precision (little-endian)
+        rather than ASCII. This moves ~4x fewer bytes over USB and PyVISA
+        decodes the definite-length block straight into a NumPy array, so
+        there is no text to parse.
+        
+        Args:
+            query: :TRACe:DATA? query selecting the buffer range and elements
+            
+        Returns:
+            Flat array of the requested elements, in buffer order
+            
+        Raises:
+            RuntimeError: If the binary block cannot be parsed
+        """
+        np = _import_numpy()
+        
+        pyvisa = _import_pyvisa()
+        inst = self.inst
+        
+        try:
+            # Switch to binary in the same transaction as the query itself
+            return inst.query_binary_values(
+                ":FORMat:DATA SREal;:FORMat:BORDer SWAPped;" + query,
+                datatype='f',
+                is_big_endian=False,
+                container=np.ndarray,
+                chunk_size=self._BUFFER_READ_CHUNK_SIZE,
+            )
+        except (ValueError, pyvisa.errors.InvalidBinaryFormat) as e:
+            raise RuntimeError(
+                f"Failed to parse buffer data from instrument. Error: {e}"
+            )
+        finally:
+            # :READ? and :MEAS? responses are parsed as text elsewhere
+            inst.write(":FORMat:DATA ASCii")
+
+    @staticmethod
+    def _plateau_mean(samples: np.ndarray, scratch: np.ndarray | None = None) -> float:
+        """
+        Average the flat top of a digitized pulse, ignoring edges and spikes.
+        
+        The central 50% of samples (in time) is taken as the pulse plateau,
+        which avoids transients at the pulse edges (rise/fall times). Within
+        the plateau the lowest and highest quarter of values are discarded
+        before averaging, so isolated digitizer spikes don't bias the result.
+        This is the same as scipy.stats.trim_mean(plateau, 0.25).
+        
+        Args:
+            samples: Digitized voltage samples covering the pulse
+            scratch: Optional float64 work buffer, at least half as long as
+                samples, that the plateau is copied into and reordered in.
+                Passing one avoids allocating a new array per pulse.
+            
+        Returns:
+            Trimmed mean plateau voltage in volts
+        """
+        np = _import_numpy()
+        
+        n = samples.size
+        start_idx = n // 4
+        end_idx = max(start_idx + 1, (3 * n) // 4)
+        m = end_idx - start_idx
+        if scratch is None:
+            scratch = np.empty(m, dtype=np.float64)
+        
+        kernel = _plateau_mean_kernel()
+        if kernel is not None:
+            return float(kernel(samples, scratch))
+        
+        plateau = scratch[:m]
+        np.copyto(plateau, samples[start_idx:end_idx])
+        
+        # Partition in place; this only orders the two trim points (O(n))
+        k = m // 4
+        if k:
+            plateau.partition((k, m - k - 1))
+        
+        return float(plateau[k:m - k].mean())
 
     def close(self):
         """
@@ -209,29 +662,32 @@ class Keithley2461:
         Turns off the output and closes the VISA session. Always call this
         when finished to leave the instrument in a safe state.
         """
-        if self.mock:
-            print("[MOCK MODE] Connection closed")
-            return
-            
         print("[SHUTDOWN] Closing instrument connection...")
         self.inst.write(":OUTP OFF")
+        self.inst.write(":FORMat:DATA ASCii")
         self.inst.close()
+        self._rm.close()
         print("[SHUTDOWN] Instrument disconnected safely")
             
     def reset(self):
         """Reset instrument to factory default state."""
-        if not self.mock:
-            self.inst.write("*RST")
+        self.inst.write("*RST")
+        # *RST disables 4-wire sensing and restores default functions
+        self._src_state = {
+            'func': None, 'sense': None, 'rsen': False, 'range_auto': False,
+            'level': None
+        }
+        # ...deletes user-created reading buffers and resizes the default one
+        self._trace_points = None
+        self._pulse_points = None
 
     def output_on(self):
         """Enable the source output."""
-        if not self.mock:
-            self.inst.write(":OUTP ON")
+        self.inst.write(":OUTP ON")
 
     def output_off(self):
         """Disable the source output (safe state)."""
-        if not self.mock:
-            self.inst.write(":OUTP OFF")
+        self.inst.write(":OUTP OFF")
     
     def beep_success(self):
         """
@@ -240,30 +696,44 @@ class Keithley2461:
         Provides audible feedback when a test completes successfully,
         useful in production environments.
         """
-        if self.mock:
-            return
-            
-        # Two-tone ascending beep: 1400Hz then 2000Hz
-        self.inst.write("SYST:BEEP:IMM 1400, 0.1")
-        time.sleep(0.1)
-        self.inst.write("SYST:BEEP:IMM 2000, 0.05")
-        time.sleep(0.05)
+        # Two-tone ascending beep: 1400Hz then 2000Hz. The instrument plays
+        # queued beeps one after the other, so both go in one write
+        self.inst.write("SYST:BEEP:IMM 1400, 0.1;:SYST:BEEP:IMM 2000, 0.05")
 
     def measure_voltage(self) -> float:
         """
         Measure the voltage at the cell terminals.
         
         Uses 4-wire sensing if configured during initialization.
-        Output must be enabled for accurate 4-wire measurements.
+        Output must be enabled for accurate 4-wire measurements. The sense
+        function is only written if it isn't voltage already (it normally
+        is, as source_current sets it).
         
         Returns:
             Measured voltage in volts
         """
-        if self.mock:
-            return 3.7  # Typical Li-ion nominal voltage
+        return self._read_voltage(":READ?")
+
+    def measure_voltage_then_off(self) -> float:
+        """
+        Measure the voltage at the cell terminals, then disable the output.
+        
+        Equivalent to measure_voltage() followed by output_off(), but sent
+        as one compound query, which saves a USB transaction. The output is
+        only switched off once the reading has been taken.
         
-        self.inst.write(':SENS:FUNC "VOLT"')
-        voltage_reading = self.inst.query(":READ?")
+        Returns:
+            Measured voltage in volts
+        """
+        return self._read_voltage(":READ?;:OUTP OFF")
+
+    def _read_voltage(self, query: str) -> float:
+        """Select voltage sensing if needed, then send a :READ? query."""
+        if self._src_state['sense'] != 'VOLT':
+            # Also leaves digitize mode if the last operation was a pulse
+            self.inst.write(':DIG:FUNC "NONE";:SENS:FUNC "VOLT"')
+        self._src_state['sense'] = 'VOLT'
+        voltage_reading = self.inst.query(query)
         voltage_value = float(voltage_reading.strip())
         return voltage_value
 
@@ -274,309 +744,1247 @@ class Keithley2461:
         Returns:
             Measured current in amperes
         """
-        if self.mock:
-            return 0.0
+        reading = self.inst.query(":MEAS:CURR?")
+        # :MEAS:CURR? switches the sense function to current
+        self._src_state['sense'] = 'CURR'
+        return self._parse_reading(reading)['current']
+
+    def _source_current_commands(self, current: float,
+                                 voltage_limit: float) -> list[str]:
+        """
+        List the SCPI commands needed to source a DC current.
+        
+        Only the parts of the configuration that differ from the tracked
+        instrument state are included. The tracked state is left alone; call
+        _mark_sourcing_current once the commands have been written.
+        
+        Args:
+            current: Target current in amperes
+            voltage_limit: Voltage compliance limit in volts
             
-        self.inst.write(":SOUR:FUNC:SHAP DC")
-        return self._parse_reading(self.inst.query(":MEAS:CURR?"))['current']
+        Returns:
+            Commands to send (possibly none), in order
+        """
+        state = self._src_state
+        commands = []
+        
+        # Leave digitize mode if the previous operation was a pulse. This
+        # replaces a full *RST, which takes ~1 s and wipes the configuration.
+        if state['sense'] != 'VOLT':
+            commands.append(':DIG:FUNC "NONE";:SENS:FUNC "VOLT"')
+        
+        # Only re-send the parts of the configuration that have changed
+        if not state['rsen']:
+            commands.append(":SENS:VOLT:RSEN ON")
+        if state['func'] != 'CURR':
+            commands.append(":SOUR:FUNC CURR")
+        if not state['range_auto']:
+            commands.append(":SOUR:CURR:RANG:AUTO ON")
+        
+        # Skip re-arming the same level, e.g. 0 A before consecutive idle reads
+        if state['level'] != (current, voltage_limit):
+            commands.append(f":SOUR:CURR:LEV {current};:SOUR:CURR:VLIM {voltage_limit}")
+        
+        return commands
+
+    def _mark_sourcing_current(self, current: float, voltage_limit: float):
+        """Record that the commands from _source_current_commands were sent."""
+        self._src_state.update(
+            sense='VOLT', rsen=True, func='CURR', range_auto=True,
+            level=(current, voltage_limit)
+        )
 
     def source_current(self, current: float, voltage_limit: float):
         """
         Configure the SMU to source a constant DC current.
         
         Sets up the instrument in current-source mode with voltage compliance.
-        The compliance limit protects the cell from over/under voltage.
+        The compliance limit protects the cell from over/under voltage. Any
+        changes are sent as one compound SCPI line.
         
         Args:
             current: Target current in amperes (positive=charge, negative=discharge)
             voltage_limit: Voltage compliance limit in volts
         """
-        if self.mock:
-            return
+        commands = self._source_current_commands(current, voltage_limit)
+        if commands:
+            self.inst.write(";".join(commands))
+        self._mark_sourcing_current(current, voltage_limit)
+
+    def arm_and_enable(self, current: float, voltage_limit: float):
+        """
+        Configure a DC current source and enable the output in one write.
         
-        # Reset to clear any previous digitize/pulse mode configuration
-        self.inst.write("*RST")
+        Equivalent to source_current() followed by output_on(), but sent as
+        a single compound SCPI line.
         
-        # Re-enable 4-wire sensing (reset disables it)
-        self.inst.write(":SENS:VOLT:RSEN ON")
+        Args:
+            current: Target current in amperes (positive=charge, negative=discharge)
+            voltage_limit: Voltage compliance limit in volts
+        """
+        commands = self._source_current_commands(current, voltage_limit)
+        self.inst.write(";".join(commands + [":OUTP ON"]))
+        self._mark_sourcing_current(current, voltage_limit)
+
+    def source_voltage(self, voltage: float, current_limit: float):
+        """
+        Configure the SMU to source a constant DC voltage.
+        
+        Sets up the instrument in voltage-source mode with current compliance.
         
-        # Configure as current source measuring voltage
-        self.inst.write(":SENS:FUNC 'VOLT'")
-        self.inst.write(":SOUR:FUNC CURR")
-        self.inst.write(":SOUR:CURR:RANG:AUTO ON")
-        self.inst.write(f":SOUR:CURR:LEV {current}")
-        self.inst.write(f":SOUR:CURR:VLIM {voltage_limit}")
+        Args:
+            voltage: Target voltage in volts
+            current_limit: Current compliance limit in amperes
+        """
+        if self._src_state['func'] != 'VOLT':
+            self.inst.write(":SOUR:FUNC VOLT")
+        self._src_state.update(func='VOLT', level=None)
+        self._write_cached(
+            ('source_voltage', voltage, current_limit),
+            lambda: f":SOUR:VOLT {voltage};:SENS:CURR:PROT {current_limit}"
+        )
+
+    def source_pulse_current(self, current: float, voltage_limit: float, 
+                             width: float, delay: float = 0) -> PulseCapture:
+        """
+        Execute a high-speed current pulse and capture voltage during the pulse.
+        
+        This method uses the Keithley's digitizer to sample voltage at 500kS/s
+        during a current pulse. The plateau voltage is the average of the
+        central 50% of samples (avoiding edge transients); the raw samples are
+        returned alongside it so callers can analyse the pulse shape.
+        
+        This is essential for accurate R0 measurements where the pulse must be
+        short enough to avoid thermal and electrochemical effects.
+        
+        The pulse delay, width and sampling are all timed by the instrument's
+        trigger model (built by :SOURce:PULSe:TRain:CURRent). The host only
+        starts it and waits on *OPC?, so OS scheduling jitter cannot change
+        the pulse.
+        
+        Args:
+            current: Pulse current in amperes (positive=charge, negative=discharge)
+            voltage_limit: Voltage compliance limit in volts
+            width: Pulse duration in seconds (e.g., 0.0025 for 2.5ms)
+            delay: Optional delay before pulse starts, in seconds
+            
+        Returns:
+            PulseCapture with the plateau voltage and the digitized samples
+            
+        Raises:
+            RuntimeError: If digitized data cannot be captured or parsed
+        """
+        np = _import_numpy()
+        
+        inst = self.inst
+
+        # Size the sample buffer to the pulse (500kS/s × pulse_width + margin)
+        # rather than 100k points: a smaller buffer is quicker to clear and
+        # the readback below only moves the samples actually taken
+        sample_rate = kDigitizerSampleRate_hz
+        expected_samples = int(sample_rate * float(width)) + 200
+
+        # Pulse train parameters
+        bias_level = 0.0
+        pulse_level = float(current)
+        pulse_width = float(width)
+        count = 1  # Single pulse
+        measure_enable = 1  # Enable digitizer during pulse
+        start_delay = max(0.0, float(delay))
+        off_time = max(0.01, 10.0 * pulse_width)  # Off time after pulse
+        x_bias_limit = float(voltage_limit)
+        x_pulse_limit = float(voltage_limit)
+
+        # The buffer only needs resizing when the pulse length changes
+        # (which also clears it); otherwise clearing it is enough
+        if self._pulse_points != expected_samples:
+            buffer_command = f':TRACe:POINTS {expected_samples}, "defbuffer1"'
+        else:
+            buffer_command = ':TRACe:CLEar "defbuffer1"'
+
+        # Configure current source, high-speed digitizer, buffer and pulse
+        # train in one write. 500kS/s sample rate captures fast transients
+        # during the pulse
+        self._write_cached(
+            ('pulse', buffer_command, pulse_level, pulse_width, start_delay,
+             x_pulse_limit),
+            lambda: self._PULSE_COMMAND_TEMPLATE.format(
+                buffer_command=buffer_command, bias=bias_level,
+                level=pulse_level, width=pulse_width, count=count,
+                measure=measure_enable, delay=start_delay, off_time=off_time,
+                bias_limit=x_bias_limit, pulse_limit=x_pulse_limit,
+            )
+        )
+        self._pulse_points = expected_samples
+        # The pulse train leaves the digitizer active, may fix the range and
+        # reprograms the source level and limit
+        self._src_state.update(
+            func='CURR', sense='DIGITIZE', range_auto=False, level=None
+        )
+
+        # Execute the pulse sequence and block until it completes. *OPC?
+        # only answers once the trigger model has finished, so we continue
+        # as soon as the pulse is done instead of sleeping a fixed margin.
+        # The VISA timeout is stretched to cover the pulse duration.
+        total_time = start_delay + pulse_width + off_time
+        previous_timeout = inst.timeout
+        inst.timeout = max(5000, int((total_time + 2) * 1000))
+        try:
+            inst.query(":INIT;*OPC?")
+        finally:
+            inst.timeout = previous_timeout
+
+        samples = self._query_buffer(
+            f':TRACe:DATA? 1, {expected_samples}, "defbuffer1", READ'
+        )
+
+        if not samples.size:
+            raise RuntimeError(
+                "No voltage samples captured during pulse. "
+                "Check instrument connections and trigger configuration."
+            )
+
+        # Grow the work buffer if a long pulse needs a bigger plateau window
+        if self._pulse_buf.size < samples.size // 2 + 1:
+            self._pulse_buf = np.empty(samples.size // 2 + 1, dtype=np.float64)
+
+        avg_voltage = self._plateau_mean(samples, self._pulse_buf)
+        return PulseCapture(avg_voltage, samples)
+
+    def start_voltage_trace(self, duration: float, n_points: int) -> float:
+        """
+        Start logging voltage readings into the instrument's buffer.
+        
+        Loads the SimpleLoop trigger model to take n_points readings spread
+        over the given duration into a dedicated "dcirbuf" buffer, then
+        returns immediately while the instrument runs. Collect the readings
+        with fetch_voltage_trace() once the duration has elapsed.
+        
+        The source is left as configured, so call arm_and_enable() (or
+        source_current() and output_on()) first.
+        
+        Args:
+            duration: Time to spread the readings over, in seconds
+            n_points: Number of readings to take
+            
+        Returns:
+            Lead time from :INIT to the first reading's timestamp in seconds
+            (the loop delay plus one aperture), which the readings' relative
+            timestamps leave out
+        """
+        inst = self.inst
+        
+        if self._line_freq is None:
+            self._line_freq = float(inst.query(":SYSTem:LFRequency?"))
+        
+        # Create the buffer once, resize it only if the point count changes
+        if self._trace_points is None:
+            inst.write(f':TRACe:MAKE "dcirbuf", {n_points}')
+        elif self._trace_points != n_points:
+            inst.write(f':TRACe:POINts {n_points}, "dcirbuf"')
+        self._trace_points = n_points
+        
+        # Each reading takes its integration time plus the loop delay, so
+        # subtract the former to keep the readings spread over `duration`
+        aperture = kDcirTraceNplc / self._line_freq
+        delay = max(0.0, duration / n_points - aperture)
+        
+        inst.write(
+            f':TRACe:CLEar "dcirbuf";'
+            f':SENSe:VOLTage:NPLCycles {kDcirTraceNplc};'
+            f':TRIGger:LOAD "SimpleLoop", {n_points}, {delay}, "dcirbuf";'
+            f':INIT'
+        )
+        self._trace_deadline = time.monotonic() + duration
+        # SimpleLoop runs its delay block before each reading, the first too
+        return delay + aperture
+
+    def fetch_voltage_trace(self) -> VoltageTrace:
+        """
+        Wait for a trace started by start_voltage_trace() and read it back.
+        
+        The readings and their relative timestamps come back in a single
+        binary transfer and are copied into one of two reused work buffers
+        (contiguous float64, ready for analyze_dcir_trace). The returned
+        arrays are read-only views into that buffer and are only valid until
+        the next-but-one call, i.e. until the next cell's DCIR test.
+        
+        Returns:
+            VoltageTrace with NumPy arrays of times and voltages
+            
+        Raises:
+            RuntimeError: If the buffer data cannot be read
+        """
+        np = _import_numpy()
+        
+        inst = self.inst
+        
+        # Block until the trigger model finishes; allow for time still to run
+        remaining = max(0.0, self._trace_deadline - time.monotonic())
+        previous_timeout = inst.timeout
+        inst.timeout = max(5000, int((remaining + 2) * 1000))
+        try:
+            inst.query("*OPC?")
+        finally:
+            inst.timeout = previous_timeout
+        
+        # Readings and timestamps are interleaved: v0, t0, v1, t1, ...
+        data = self._query_buffer(
+            f':TRACe:DATA? 1, {self._trace_points}, "dcirbuf", READ, REL'
+        )
+        if not data.size:
+            raise RuntimeError("No voltage readings logged during DCIR load.")
+        
+        n = data.size // 2
+        buf = self._trace_bufs[self._trace_slot]
+        if buf.shape[1] < n:
+            buf = np.empty((2, n), dtype=np.float64)
+            self._trace_bufs[self._trace_slot] = buf
+        self._trace_slot ^= 1
+        
+        out = buf[:, :n]
+        out[0] = data[1:2 * n:2]
+        out[1] = data[0:2 * n:2]
+        out.flags.writeable = False
+        return VoltageTrace(time=out[0], voltage=out[1])
+
+    def is_responsive(self) -> bool:
+        """
+        Check that the instrument still answers queries.
+        
+        Returns:
+            True if *OPC? was answered, False on any communication error
+        """
+        try:
+            self.inst.query("*OPC?")
+            return True
+        except Exception:
+            return False
+
+    def identify(self) -> dict:
+        """
+        Return the instrument identification.
+        
+        *IDN? is only queried on the first call; the reply cannot change
+        while connected, so it is cached for the session.
+        
+        Returns:
+            Dictionary containing:
+                - raw: Full *IDN? reply
+                - manufacturer, model, serial, firmware: Reply fields, or
+                  None if the reply doesn't have the usual four
+        """
+        if self._idn is None:
+            raw = self.inst.query("*IDN?").strip()
+            match = self._IDN_PATTERN.fullmatch(raw)
+            fields = match.groups() if match else (None,) * 4
+            self._idn = {
+                'raw': raw,
+                'manufacturer': fields[0],
+                'model': fields[1],
+                'serial': fields[2],
+                'firmware': fields[3],
+            }
+        return self._idn
+
+    def test_connection(self) -> bool:
+        """
+        Verify communication with the instrument.
+        
+        Queries the instrument identification and plays a success beep.
+        Use this to validate the setup before running tests.
+        
+        Returns:
+            True if connection is successful, False otherwise
+        """
+        try:
+            # A cached identification proves nothing about the link now
+            if self._idn is not None and not self.is_responsive():
+                raise RuntimeError("Instrument did not answer *OPC?")
+            idn = self.identify()
+            self.beep_success()
+            
+            lines = [
+                "\n" + "=" * 50,
+                "CONNECTION TEST: PASSED",
+                "=" * 50,
+            ]
+            if idn['model'] is not None:
+                lines += [
+                    f"  Manufacturer : {idn['manufacturer']}",
+                    f"  Model        : {idn['model']}",
+                    f"  Serial       : {idn['serial']}",
+                    f"  Firmware     : {idn['firmware']}",
+                ]
+            else:
+                lines.append(f"  Instrument ID: {idn['raw']}")
+            lines.append("=" * 50 + "\n")
+            print("\n".join(lines))
+            return True
+            
+        except Exception as e:
+            print("\n".join([
+                "\n" + "=" * 50,
+                "CONNECTION TEST: FAILED",
+                "=" * 50,
+                f"  Error: {e}",
+                "\nTroubleshooting:",
+                "  1. Verify USB cable connection",
+                "  2. Check instrument power",
+                "  3. Confirm RESOURCE_NAME matches your instrument",
+                "  4. Try: pyvisa.ResourceManager('@py').list_resources()",
+                "=" * 50 + "\n",
+            ]))
+            return False
+
+
+class MockKeithley2461(Keithley2461):
+    """
+    Simulated Keithley 2461 for developing and exercising the test flow
+    without hardware.
+    
+    Overrides every method that talks to the instrument with canned
+    responses, so the hardware driver itself carries no mock-mode branches.
+    """
+
+    mock = True
+
+    def __init__(self, resource_name: str):
+        """
+        Pretend to connect to the instrument.
+        
+        Args:
+            resource_name: VISA resource string (only used for the log message)
+        """
+        self.inst = None
+        print(f"[MOCK MODE] Simulating connection to {resource_name}")
+
+    def close(self):
+        print("[MOCK MODE] Connection closed")
+
+    def reset(self):
+        pass
+
+    def output_on(self):
+        pass
+
+    def output_off(self):
+        pass
+
+    def beep_success(self):
+        pass
+
+    def measure_voltage(self) -> float:
+        return 3.7  # Typical Li-ion nominal voltage
+
+    def measure_voltage_then_off(self) -> float:
+        return self.measure_voltage()
+
+    def measure_current(self) -> float:
+        return 0.0
+
+    def source_current(self, current: float, voltage_limit: float):
+        pass
+
+    def arm_and_enable(self, current: float, voltage_limit: float):
+        pass
+
+    def source_voltage(self, voltage: float, current_limit: float):
+        pass
+
+    def source_pulse_current(self, current: float, voltage_limit: float,
+                             width: float, delay: float = 0) -> PulseCapture:
+        # Simulate voltage change under load based on ~25mΩ internal resistance
+        return PulseCapture(3.8 if current > 0 else 3.6, None)
+
+    def start_voltage_trace(self, duration: float, n_points: int) -> float:
+        self._trace = VoltageTrace(
+            time=[duration * i / n_points for i in range(n_points)],
+            voltage=[3.7] * n_points,
+        )
+        # Same lead time as the real loop: delay plus aperture, one interval
+        return duration / n_points
+
+    def fetch_voltage_trace(self) -> VoltageTrace:
+        return self._trace
+
+    def is_responsive(self) -> bool:
+        return True
+
+    def identify(self) -> dict:
+        return {
+            'raw': "MOCK,MODEL 2461,0,0", 'manufacturer': "MOCK",
+            'model': "MODEL 2461", 'serial': "0", 'firmware': "0",
+        }
+
+    def test_connection(self) -> bool:
+        print("[MOCK MODE] Connection test: PASSED")
+        return True
+
+
+def make_smu(resource_name: str, mock: bool = False) -> Keithley2461:
+    """
+    Create the instrument driver for a resource.
+    
+    Args:
+        resource_name: VISA resource string
+        mock: If True, return a simulated instrument instead of real hardware
+        
+    Returns:
+        Keithley2461 connected to the instrument, or a MockKeithley2461
+    """
+    if mock:
+        return MockKeithley2461(resource_name)
+    return Keithley2461(resource_name)
+
+
+# =============================================================================
+# CSV Helper Functions
+# =============================================================================
+
+# Output CSV column structure
+FIELDNAMES = (
+    "Serial Number", 
+    "OCV (V)", 
+    "R0 (Ohm)", 
+    "R0 Charge (Ohm)", 
+    "R0 Discharge (Ohm)", 
+    "DCIR (Ohm)", 
+    "DCIR Charge (Ohm)", 
+    "DCIR Discharge (Ohm)",
+    # Added later, so they go last: positional readers (group_cells.py) and
+    # files written before them keep working
+    "DCIR Ohmic (Ohm)",
+    "DCIR Rct (Ohm)",
+    "DCIR Tau (s)",
+    "DCIR Warburg (Ohm/s^0.5)",
+    "Status",
+)
+
+# Values of the Status column. Retesting a cell doesn't rewrite the file:
+# a "superseded" tombstone row (serial number only) is appended, followed
+# by the new results. A cell's current result is its last active row not
+# followed by a tombstone; files from before the column are all active.
+STATUS_ACTIVE = "active"
+STATUS_SUPERSEDED = "superseded"
+
+# I/O buffer size for whole-file CSV rewrites (fewer read/write syscalls)
+_CSV_BUFFER_SIZE = 65536
+
+# Duplicate checks used to rescan the whole output CSV for every cell. Instead
+# an index of serial number -> byte offset of its row is built once, kept in
+# memory, and persisted next to the CSV as '<csv>.idx'. An index is only
+# trusted while the CSV's size and modification time match the ones it was
+# recorded against, so edits made outside this script trigger a rebuild.
+#
+# Each index entry is a dict with the same shape as the persisted JSON:
+#   {"signature": [size, mtime_ns], "header": [...], "index": {serial: offset}}
+# Keeping the header alongside means a lookup only ever reads the one row.
+
+_serial_cache: dict[str, dict] = {}
+
+
+def _csv_signature(csv_path: str) -> list:
+    """Return [size, mtime_ns] identifying the current contents of a file."""
+    st = os.stat(csv_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _build_serial_index(csv_path: str) -> tuple[list, dict[str, int]]:
+    """
+    Scan the CSV once and map each serial number to the byte offset of its row.
+    
+    Rows are parsed positionally with csv.reader; the serial and status
+    column indices are looked up once from the header.
+    
+    Args:
+        csv_path: Path to the CSV file
+        
+    Returns:
+        Tuple of (header row, serial number to row offset dictionary).
+        Each serial maps to its current row; superseded serials are absent.
+    """
+    index = {}
+    with open(csv_path, 'rb') as csvfile:
+        header = next(csv.reader([csvfile.readline().decode('utf-8-sig')]), [])
+        if "Serial Number" not in header:
+            return header, index
+        serial_idx = header.index("Serial Number")
+        status_idx = header.index("Status") if "Status" in header else None
+        
+        while True:
+            offset = csvfile.tell()
+            line = csvfile.readline()
+            if not line:
+                break
+            row = next(csv.reader([line.decode('utf-8')]), None)
+            if not row or len(row) <= serial_idx:
+                continue
+            if (status_idx is not None and len(row) > status_idx
+                    and row[status_idx] == STATUS_SUPERSEDED):
+                index.pop(row[serial_idx], None)
+            else:
+                index[row[serial_idx]] = offset
+    
+    return header, index
+
+
+def _save_serial_index(csv_path: str, entry: dict):
+    """Persist an index next to the CSV. Failure only costs a rebuild later."""
+    try:
+        with open(csv_path + ".idx", 'w') as idxfile:
+            json.dump(entry, idxfile)
+    except OSError:
+        pass
+
+
+def _get_serial_index(csv_path: str) -> dict | None:
+    """
+    Return the serial number index for a CSV, loading or rebuilding as needed.
+    
+    Args:
+        csv_path: Path to the CSV file
+        
+    Returns:
+        Index entry (see above), or None if the CSV doesn't exist
+    """
+    try:
+        signature = _csv_signature(csv_path)
+    except FileNotFoundError:
+        return None
+    
+    entry = _serial_cache.get(csv_path)
+    if entry is not None and entry["signature"] == signature:
+        return entry
+    
+    try:
+        with open(csv_path + ".idx", 'r') as idxfile:
+            entry = json.load(idxfile)
+        if entry["signature"] != signature or not isinstance(entry["header"], list):
+            entry = None
+    except (OSError, ValueError, KeyError, TypeError):
+        entry = None
+    
+    if entry is None:
+        header, index = _build_serial_index(csv_path)
+        entry = {"signature": signature, "header": header, "index": index}
+        _save_serial_index(csv_path, entry)
+    
+    _serial_cache[csv_path] = entry
+    return entry
+
+
+def record_serial(csv_path: str, serial_number: str, offset: int,
+                  status: str = STATUS_ACTIVE):
+    """
+    Add a freshly appended row to the serial number index.
+    
+    Args:
+        csv_path: Path to the CSV file the row was appended to
+        serial_number: Serial number of the new row
+        offset: Byte offset the row was written at (file size before append)
+        status: Status column of the new row; a tombstone unindexes the serial
+    """
+    entry = _serial_cache.get(csv_path)
+    if entry is None or entry["signature"][0] != offset:
+        # Index not loaded, or the file changed behind our back
+        invalidate_serial_index(csv_path)
+        return
+    
+    if status == STATUS_SUPERSEDED:
+        entry["index"].pop(serial_number, None)
+    else:
+        entry["index"][serial_number] = offset
+    entry["signature"] = _csv_signature(csv_path)
+    _save_serial_index(csv_path, entry)
+
+
+def invalidate_serial_index(csv_path: str):
+    """Discard the in-memory and persisted index after rewriting the CSV."""
+    _serial_cache.pop(csv_path, None)
+    try:
+        os.remove(csv_path + ".idx")
+    except FileNotFoundError:
+        pass
+
+
+def check_duplicate_serial(csv_path: str, serial_number: str) -> dict | None:
+    """
+    Check if a serial number already exists in the CSV file.
+    
+    Looks the serial up in the index and reads back only the matching row;
+    only that row is turned into a dictionary.
+    
+    Args:
+        csv_path: Path to the CSV file
+        serial_number: Serial number to check for
+        
+    Returns:
+        The existing row as a dictionary if found, None otherwise
+    """
+    entry = _get_serial_index(csv_path)
+    if entry is None:
+        return None  # File doesn't exist yet, no duplicates possible
+    
+    offset = entry["index"].get(serial_number)
+    if offset is None:
+        return None
+    
+    with open(csv_path, 'rb') as csvfile:
+        csvfile.seek(offset)
+        row = next(csv.reader([csvfile.readline().decode('utf-8')]))
+    
+    return dict(zip(entry["header"], row))
+
+
+# Characters that force a CSV field to be quoted
+_CSV_SPECIAL_CHARS = frozenset(',"\r\n')
+
+
+def format_csv_line(fields) -> str:
+    """
+    Format one CSV line, as csv.writer would with its default dialect.
+    
+    Fields are joined directly instead of going through csv.writer's
+    per-field quoting logic; only a field that contains a delimiter, quote
+    or line break (in practice only ever a typed serial number) is quoted.
+    
+    Args:
+        fields: Iterable of field values (numbers or strings)
+        
+    Returns:
+        The formatted line, including its CRLF terminator
+    """
+    out = []
+    for value in fields:
+        text = str(value)
+        if not _CSV_SPECIAL_CHARS.isdisjoint(text):
+            text = '"' + text.replace('"', '""') + '"'
+        out.append(text)
+    return ",".join(out) + "\r\n"
+
+
+def append_row(csvfile, row: dict):
+    """
+    Append a row to the open results file and add it to the serial index.
+    
+    The row is flushed straight away so it is on disk before the next cell.
+    
+    Args:
+        csvfile: Results file, open for appending (with newline='')
+        row: Row to write, keyed by FIELDNAMES (missing columns are left
+            empty); must include "Serial Number" and "Status"
+    """
+    offset = csvfile.tell()
+    csvfile.write(format_csv_line(row.get(name, "") for name in FIELDNAMES))
+    csvfile.flush()
+    record_serial(csvfile.name, row["Serial Number"], offset, row["Status"])
+
+
+def mark_serial_superseded(csvfile, serial_number: str):
+    """
+    Retire a serial number's existing results before it is retested.
+    
+    Appends a tombstone row instead of rewriting the file, so a retest costs
+    one short write however large the file has grown. The old row stays in
+    the file for reference; readers skip it (see STATUS_SUPERSEDED).
+    
+    Args:
+        csvfile: Results file, open for appending
+        serial_number: Serial number whose results are superseded
+    """
+    append_row(csvfile, {
+        "Serial Number": serial_number, "Status": STATUS_SUPERSEDED
+    })
+    print(f"[CSV] Marked previous entry for {serial_number} as superseded")
+
+
+def upgrade_csv_header(csv_path: str) -> bool:
+    """
+    Bring an existing results file's header up to date with FIELDNAMES.
+    
+    New columns are only ever appended to FIELDNAMES, so a file written by
+    an older version has a header that is a prefix of it. Such a file gets
+    the full header; existing rows are left as they are (with their later
+    columns simply empty). An empty file (e.g. one just created with touch)
+    has an empty header, so it is given the full header too. The rewrite
+    streams through a temporary file in the same directory, which then
+    atomically replaces the original.
+    
+    Args:
+        csv_path: Path to the CSV file
+        
+    Returns:
+        True if the header was rewritten, False if it was already current
+        
+    Raises:
+        ValueError: If the header doesn't match FIELDNAMES
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig',
+              buffering=_CSV_BUFFER_SIZE) as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, [])
+        if header == list(FIELDNAMES):
+            return False
+        if header != list(FIELDNAMES[:len(header)]):
+            raise ValueError(
+                f"{csv_path} has unexpected columns; expected {list(FIELDNAMES)}"
+            )
+        
+        tmp = tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(os.path.abspath(csv_path)), delete=False,
+            newline='', encoding='utf-8', buffering=_CSV_BUFFER_SIZE
+        )
+        try:
+            with tmp:
+                writer = csv.writer(tmp)
+                writer.writerow(FIELDNAMES)
+                writer.writerows(reader)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    
+    shutil.copymode(csv_path, tmp.name)
+    os.replace(tmp.name, csv_path)
+    invalidate_serial_index(csv_path)
+    return True
+
 
-    def source_voltage(self, voltage: float, current_limit: float):
-        """
-        Configure the SMU to source a constant DC voltage.
+def prepare_output_csv(csv_path: str) -> list[str]:
+    """
+    Make the results file ready for appending.
+    
+    Creates the file with a header if it doesn't exist, otherwise brings its
+    header up to date (see upgrade_csv_header). Also loads the serial index
+    used by the duplicate checks, so the first check doesn't pay for a scan
+    of a large file.
+    
+    Nothing is printed here, since this runs on a worker thread alongside
+    the instrument setup; the caller prints the returned messages.
+    
+    Args:
+        csv_path: Path to the CSV file
         
-        Sets up the instrument in voltage-source mode with current compliance.
+    Returns:
+        Status messages describing what was done, in order
         
-        Args:
-            voltage: Target voltage in volts
-            current_limit: Current compliance limit in amperes
-        """
-        if self.mock:
-            return
-            
-        self.inst.write(":SOUR:FUNC:SHAP DC")
-        self.inst.write(":SOUR:FUNC VOLT")
-        self.inst.write(f":SOUR:VOLT {voltage}")
-        self.inst.write(f":SENS:CURR:PROT {current_limit}")
+    Raises:
+        ValueError: If an existing file's header doesn't match FIELDNAMES
+    """
+    messages = []
+    try:
+        with open(csv_path, 'x', newline='', encoding='utf-8') as csvfile:
+            csvfile.write(format_csv_line(FIELDNAMES))
+        messages.append(f"[CSV] Created new output file: {csv_path}")
+    except FileExistsError:
+        if upgrade_csv_header(csv_path):
+            messages.append(f"[CSV] Added new columns to header of: {csv_path}")
+        messages.append(f"[CSV] Appending to existing file: {csv_path}")
+    
+    _get_serial_index(csv_path)
+    return messages
 
-    def source_pulse_current(self, current: float, voltage_limit: float, 
-                             width: float, delay: float = 0) -> float:
+
+def save_voltage_trace(csv_path: str, trace: VoltageTrace):
+    """
+    Write a logged voltage trace to its own CSV file.
+    
+    Args:
+        csv_path: Path of the file to create (overwritten if it exists)
+        trace: Trace returned by fetch_voltage_trace()
+    """
+    lines = [format_csv_line(("Time (s)", "Voltage (V)"))]
+    lines.extend(f"{t},{v}\r\n" for t, v in zip(trace.time, trace.voltage))
+    with open(csv_path, 'w', newline='') as csvfile:
+        csvfile.write("".join(lines))
+
+
+# Characters replaced with '_' when a serial number is used in a file name
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def save_dcir_traces(trace_dir: str, serial_number: str, dcir: DcirResult):
+    """
+    Save a cell's DCIR voltage traces, warning instead of raising on failure.
+    
+    The traces go to <serial>_dcir_charge.csv and <serial>_dcir_discharge.csv
+    in trace_dir. Characters other than letters, digits, '.', '_' and '-' in
+    the serial number are replaced with '_', so a scanned serial can't name
+    a path outside the directory. The traces are supplementary, so a failed
+    write only prints a warning; the cell's results are already in the CSV.
+    
+    Args:
+        trace_dir: Directory to save the traces in (must exist)
+        serial_number: Cell identification string
+        dcir: DCIR test result holding the charge and discharge traces
+    """
+    safe_serial = _UNSAFE_FILENAME_CHARS.sub("_", serial_number)
+    for direction, trace in (("charge", dcir.trace_charge),
+                             ("discharge", dcir.trace_discharge)):
+        path = os.path.join(trace_dir, f"{safe_serial}_dcir_{direction}.csv")
+        try:
+            save_voltage_trace(path, trace)
+        except OSError as e:
+            print(f"[WARNING] Could not save {direction} trace to {path}: {e}")
+
+
+# =============================================================================
+# Console Output
+# =============================================================================
+
+# Writes that can be pending before print() blocks, i.e. how long a stall in
+# whatever reads stdout (a pipe, tee, a paused terminal) can be absorbed
+_CONSOLE_QUEUE_SIZE = 10000
+
+
+class QueuedStdout:
+    """
+    Stand-in for sys.stdout that hands writes to a background thread.
+    
+    Writing to a pipe blocks as soon as the reader falls behind, which would
+    stall the test loop mid-cell. With this installed as sys.stdout, print()
+    only queues its text; a daemon thread writes each piece to the real
+    stream in order and flushes it straight away. Only once the queue is
+    full does print() block. flush() waits until everything queued has been
+    written, so a prompt flushed before input is read still appears after
+    the output queued ahead of it.
+    
+    On POSIX the thread writes straight to the stream's file descriptor. If
+    that is non-blocking and the reader stalls, it waits for the descriptor
+    to become writable and sends the rest, so nothing is lost. Text is only
+    dropped once the reader has gone away (e.g. a closed pipe).
+    """
+    
+    def __init__(self, stream, maxsize: int = _CONSOLE_QUEUE_SIZE):
         """
-        Execute a high-speed current pulse and capture voltage during the pulse.
-        
-        This method uses the Keithley's digitizer to sample voltage at 500kS/s
-        during a current pulse. The returned voltage is the average of the
-        central 50% of samples (avoiding edge transients).
-        
-        This is essential for accurate R0 measurements where the pulse must be
-        short enough to avoid thermal and electrochemical effects.
+        Start the writer thread.
         
         Args:
-            current: Pulse current in amperes (positive=charge, negative=discharge)
-            voltage_limit: Voltage compliance limit in volts
-            width: Pulse duration in seconds (e.g., 0.0025 for 2.5ms)
-            delay: Optional delay before pulse starts, in seconds
-            
-        Returns:
-            Average voltage during pulse plateau (central 50% of samples)
-            
-        Raises:
-            RuntimeError: If digitized data cannot be captured or parsed
+            stream: Stream to write to (normally the original sys.stdout)
+            maxsize: Maximum number of queued writes
         """
-        if self.mock:
-            # Simulate voltage change under load based on ~25mΩ internal resistance
-            return 3.8 if current > 0 else 3.6
-
-        inst = self.inst
+        self.stream = stream
+        self._fd = None
+        if os.name == 'posix':
+            try:
+                self._fd = stream.fileno()
+                stream.flush()
+            except (AttributeError, ValueError, OSError):
+                self._fd = None
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+    
+    def _drain(self):
+        while True:
+            text = self._queue.get()
+            try:
+                if text is None:
+                    return
+                if self._fd is None:
+                    self.stream.write(text)
+                    self.stream.flush()
+                else:
+                    self._write_fd(text)
+            except (BrokenPipeError, ValueError, OSError):
+                pass  # Reader went away; keep draining so writers never block
+            finally:
+                self._queue.task_done()
+    
+    def _write_fd(self, text: str):
+        """Write text to the file descriptor, waiting out a stalled reader."""
+        data = text.encode(self.stream.encoding or 'utf-8',
+                           self.stream.errors or 'strict')
+        while data:
+            try:
+                data = data[os.write(self._fd, data):]
+            except BlockingIOError:
+                # os.write() writes nothing when it raises; wait and resend
+                select.select([], [self._fd], [])
+    
+    def write(self, text: str) -> int:
+        if text:
+            self._queue.put(text)
+        return len(text)
+    
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        self._queue.join()
+    
+    def close(self):
+        """Write out everything still queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def __getattr__(self, name):
+        # encoding, isatty(), fileno() etc. come from the real stream
+        return getattr(self.stream, name)
 
-        # Configure source function for current output with readback
-        inst.write(":SOURce:FUNC CURRent")
-        inst.write(":SOURce:CURRent:READ:BACK ON")
 
-        # Configure digitizer for high-speed voltage acquisition
-        # 500kS/s sample rate captures fast transients during the pulse
-        inst.write(':DIGitize:FUNC "VOLTage"')
-        inst.write(":DIGitize:VOLTage:RSENse ON")   # Use 4-wire sensing
-        inst.write(":DIGitize:VOLTage:RANGe 10")    # 10V range for Li-ion
-        inst.write(":DIGitize:VOLTage:SRATe 500000") # 500kS/s sample rate
+# =============================================================================
+# Operator Input
+# =============================================================================
 
-        # Allocate buffer for digitized samples
-        inst.write(':TRACe:POINTS 100000, "defbuffer1"')
+# asyncio stream over stdin, created by the first ainput() call. Only used on
+# POSIX, and only when stdin is a pipe or socket (not a terminal or file).
+_stdin_reader: asyncio.StreamReader | None = None
+_stdin_reader_unavailable = sys.platform == 'win32'
+
+
+async def _get_stdin_reader() -> asyncio.StreamReader | None:
+    """Return the stdin stream reader, or None if it can't be used here."""
+    global _stdin_reader, _stdin_reader_unavailable
+    if _stdin_reader is None and not _stdin_reader_unavailable:
+        # Only pipes and sockets are used. A file or a device such as
+        # /dev/null would be accepted here and then fail in the loop, and a
+        # terminal usually shares its open file with stdout and stderr, so
+        # making it non-blocking would make prints to a slow or paused
+        # terminal fail with BlockingIOError
+        try:
+            mode = os.fstat(sys.stdin.fileno()).st_mode
+            pollable = stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+        except (AttributeError, ValueError, OSError):
+            pollable = False
+        if not pollable:
+            _stdin_reader_unavailable = True
+            return None
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        try:
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+            )
+        except (ValueError, OSError):
+            _stdin_reader_unavailable = True
+        else:
+            _stdin_reader = reader
+            # The transport makes stdin non-blocking; undo that on exit so
+            # the shell (or whatever reads the terminal next) isn't affected
+            atexit.register(os.set_blocking, sys.stdin.fileno(), True)
+    return _stdin_reader
 
-        # Build pulse train command
-        # Format: bias, level, width, count, measure, buffer, delay, off_time, 
-        #         bias_limit, pulse_limit, fail_abort
-        bias_level = 0.0
-        pulse_level = float(current)
-        pulse_width = float(width)
-        count = 1  # Single pulse
-        measure_enable = 1  # Enable digitizer during pulse
-        start_delay = max(0.0, float(delay))
-        off_time = max(0.01, 10.0 * pulse_width)  # Off time after pulse
-        x_bias_limit = float(voltage_limit)
-        x_pulse_limit = float(voltage_limit)
 
-        cmd = (
-            f":SOURce:PULSe:TRain:CURRent "
-            f"{bias_level}, {pulse_level}, {pulse_width}, "
-            f"{count}, {measure_enable}, \"defbuffer1\", "
-            f"{start_delay}, {off_time}, "
-            f"{x_bias_limit}, {x_pulse_limit}, 0"
-        )
-        inst.write(cmd)
+async def ainput(prompt: str = "") -> str:
+    """
+    Read a line from stdin without blocking the event loop.
+    
+    When stdin is a pipe or socket (on POSIX), it is read through an asyncio
+    stream, so waiting for a scan costs nothing and can be cancelled cleanly
+    by Ctrl+C. Otherwise (a terminal, a redirected file, or on Windows)
+    input() runs on its own daemon thread and the result is handed back to
+    the loop. A daemon thread is used rather than the loop's default
+    executor because executor threads are joined at interpreter exit, which
+    would leave the script hanging on an unanswered prompt after Ctrl+C.
+    
+    Args:
+        prompt: Text displayed before reading
         
-        # Calculate expected sample count: 500kS/s × pulse_width + margin
-        sample_rate = 500000
-        expected_samples = int(sample_rate * pulse_width) + 100
-
-        # Execute the pulse sequence
-        inst.write(":INIT")
+    Returns:
+        The line entered, without the trailing newline
         
-        # Wait for pulse to complete (with safety margin)
-        total_time = start_delay + pulse_width + off_time + 0.5
-        time.sleep(total_time)
+    Raises:
+        EOFError: If stdin is closed
+    """
+    reader = await _get_stdin_reader()
+    if reader is not None:
+        print(prompt, end='', flush=True)
+        line = await reader.readline()
+        if not line:
+            raise EOFError("EOF when reading a line")
+        return line.decode(sys.stdin.encoding or 'utf-8').rstrip('\r\n')
+    
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(setter, value):
+        if not future.done():
+            setter(value)
 
-        # Retrieve digitized voltage samples from buffer
-        inst.write(f':TRACe:DATA? 1, {expected_samples}, "defbuffer1", READ')
-        raw = inst.read_raw().decode('ascii').strip()
-       
+    def read_line():
         try:
-            samples = [float(s) for s in raw.strip().split(",") if s.strip()]
-        except ValueError as e:
-            raise RuntimeError(
-                f"Failed to parse digitized voltage data from instrument. "
-                f"Raw response: {raw!r}. Error: {e}"
-            )
+            line = input(prompt)
+        except Exception as e:
+            loop.call_soon_threadsafe(resolve, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(resolve, future.set_result, line)
 
-        if not samples:
-            raise RuntimeError(
-                "No voltage samples captured during pulse. "
-                "Check instrument connections and trigger configuration."
-            )
+    threading.Thread(target=read_line, daemon=True).start()
+    return await future
 
-        # Extract the central 50% of samples as the pulse plateau
-        # This avoids transients at pulse edges (rise/fall times)
-        n = len(samples)
-        start_idx = n // 4
-        end_idx = max(start_idx + 1, (3 * n) // 4)
-        plateau = samples[start_idx:end_idx]
 
-        avg_voltage = sum(plateau) / len(plateau)
-        return avg_voltage
+# Accepted answers to the duplicate prompt and the action each one selects
+_DUPLICATE_CHOICES = {
+    'R': 'retest', 'RETEST': 'retest',
+    'S': 'skip', 'SKIP': 'skip',
+    'N': 'rename', 'NEW': 'rename',
+}
 
-    def test_connection(self) -> bool:
-        """
-        Verify communication with the instrument.
-        
-        Queries the instrument identification and plays a success beep.
-        Use this to validate the setup before running tests.
+
+async def prompt_duplicate_action(serial_number: str, existing_data: dict) -> str:
+    """
+    Prompt the user for action when a duplicate serial number is detected.
+    
+    Args:
+        serial_number: The duplicate serial number
+        existing_data: The existing row data from the CSV
         
-        Returns:
-            True if connection is successful, False otherwise
-        """
-        if self.mock:
-            print("[MOCK MODE] Connection test: PASSED")
-            return True
+    Returns:
+        User's choice: 'retest', 'skip', or 'rename'
+    """
+    print("\n".join([
+        "\n" + "-" * 60,
+        f"DUPLICATE DETECTED: {serial_number}",
+        "-" * 60,
+        "\nThis cell already has test results in the output file:",
+        f"  OCV  : {float(existing_data.get('OCV (V)', 0)):.4f} V",
+        f"  R0   : {float(existing_data.get('R0 (Ohm)', 0))*1000:.2f} mΩ",
+        f"  DCIR : {float(existing_data.get('DCIR (Ohm)', 0))*1000:.2f} mΩ",
+        "\nOptions:",
+        "  [R] Retest - Test it again! This will REPLACE the previous results",
+        "  [S] Skip   - Cancel and enter a different serial number",
+        "  [N] New    - This is a DIFFERENT cell, enter a new serial number",
+    ]))
+    
+    while True:
+        choice = (await ainput("\nYour choice (R/S/N): ")).strip().upper()
         
         try:
-            idn = self.inst.query("*IDN?")
-            self.beep_success()
-            
-            idn_parts = idn.strip().split(',')
-            print("\n" + "=" * 50)
-            print("CONNECTION TEST: PASSED")
-            print("=" * 50)
-            
-            if len(idn_parts) >= 4:
-                print(f"  Manufacturer : {idn_parts[0]}")
-                print(f"  Model        : {idn_parts[1]}")
-                print(f"  Serial       : {idn_parts[2]}")
-                print(f"  Firmware     : {idn_parts[3]}")
-            else:
-                print(f"  Instrument ID: {idn.strip()}")
-                
-            print("=" * 50 + "\n")
-            return True
-            
-        except Exception as e:
-            print("\n" + "=" * 50)
-            print("CONNECTION TEST: FAILED")
-            print("=" * 50)
-            print(f"  Error: {e}")
-            print("\nTroubleshooting:")
-            print("  1. Verify USB cable connection")
-            print("  2. Check instrument power")
-            print("  3. Confirm RESOURCE_NAME matches your instrument")
-            print("  4. Try: pyvisa.ResourceManager('@py').list_resources()")
-            print("=" * 50 + "\n")
-            return False
+            return _DUPLICATE_CHOICES[choice]
+        except KeyError:
+            print("  Invalid choice. Please enter R, S, or N.")
 
 
 # =============================================================================
-# CSV Helper Functions
+# Individual Test Functions
 # =============================================================================
 
-def check_duplicate_serial(csv_path: str, serial_number: str) -> dict | None:
+def pulse_onset_voltage(capture: PulseCapture) -> float:
     """
-    Check if a serial number already exists in the CSV file.
+    Estimate the cell voltage at the instant a current pulse starts.
+    
+    Fits a straight line to kR0OnsetWindow_seconds of digitized samples and
+    extrapolates it back to the current step (t = 0). The first
+    kR0OnsetSettle_seconds are skipped: the source current is still rising
+    there, so those samples sit near the pre-step voltage and would pull
+    the intercept (and hence R0) towards zero. Unlike the plateau mean this
+    excludes the polarization that builds up over the pulse, so the R0
+    derived from it is closer to the true ohmic resistance.
     
     Args:
-        csv_path: Path to the CSV file
-        serial_number: Serial number to check for
+        capture: Result of Keithley2461.source_pulse_current
         
     Returns:
-        The existing row as a dictionary if found, None otherwise
+        Extrapolated onset voltage in volts. Falls back to the plateau mean
+        when no samples are available (mock mode) or too few to fit.
     """
-    try:
-        with open(csv_path, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row.get("Serial Number") == serial_number:
-                    return row
-    except FileNotFoundError:
-        pass  # File doesn't exist yet, no duplicates possible
+    samples = capture.samples
+    start = int(kR0OnsetSettle_seconds * kDigitizerSampleRate_hz)
+    stop = start + int(kR0OnsetWindow_seconds * kDigitizerSampleRate_hz)
+    if samples is None or min(stop, len(samples)) - start < 2:
+        return capture.plateau_mean
+    
+    np = _import_numpy()
     
-    return None
+    window = samples[start:stop].astype(np.float64)
+    # Sample times from the step, so the intercept is the voltage at t = 0
+    t = np.arange(start, start + window.size,
+                  dtype=np.float64) / kDigitizerSampleRate_hz
+    
+    # Least-squares line v = v0 + slope * t; only the intercept is needed
+    t_centered = t - t.mean()
+    slope = np.dot(t_centered, window) / np.dot(t_centered, t_centered)
+    return float(window.mean() - slope * t.mean())
 
 
-def remove_serial_from_csv(csv_path: str, serial_number: str, fieldnames: list):
+def analyze_dcir_trace(trace: VoltageTrace, v_idle: float,
+                       current: float) -> DcirFit:
     """
-    Remove an entry with the given serial number from the CSV file.
+    Fit a polarization model to the voltage logged during a DCIR load.
+    
+    The voltage is modelled as
     
-    Reads all rows, filters out the matching serial number, and rewrites the file.
+        v(t) = v_idle + I * (R_ohm + R_ct * (1 - exp(-t / tau)) + sigma * sqrt(t))
+    
+    i.e. an ohmic step, a charge-transfer RC term and a Warburg diffusion
+    term, with t measured from the current step (trace.step_delay before
+    the first reading). For a fixed tau the model is linear in the other parameters, so
+    it is solved by least squares for every tau on a log-spaced grid at
+    once (as one batched NumPy operation) and the best fit kept. This
+    needs no SciPy and cannot fail to converge.
     
     Args:
-        csv_path: Path to the CSV file
-        serial_number: Serial number to remove
-        fieldnames: List of CSV column names for rewriting
+        trace: Voltage trace logged during the load
+        v_idle: Idle voltage measured before the load, in volts
+        current: Load current in amperes (positive=charge, negative=discharge)
+        
+    Returns:
+        DcirFit with the fitted parameters (all NaN if the trace is too short)
     """
-    rows_to_keep = []
+    np = _import_numpy()
     
-    try:
-        with open(csv_path, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row.get("Serial Number") != serial_number:
-                    rows_to_keep.append(row)
-    except FileNotFoundError:
-        return  # Nothing to remove
+    t = np.asarray(trace.time, dtype=np.float64)
+    v = np.asarray(trace.voltage, dtype=np.float64)
+    if t.size < 4 or t[-1] <= t[0]:
+        nan = float('nan')
+        return DcirFit(nan, nan, nan, nan)
+    t = t - t[0] + trace.step_delay
     
-    # Rewrite the file without the removed entry
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows_to_keep)
+    # Candidate time constants from one reading interval to the full window
+    taus = np.geomspace((t[-1] - t[0]) / (t.size - 1), t[-1], 64)
+    
+    # Design matrices for every tau: columns [1, 1 - exp(-t/tau), sqrt(t)]
+    basis = np.empty((taus.size, t.size, 3))
+    basis[:, :, 0] = 1.0
+    basis[:, :, 1] = -np.expm1(-t[None, :] / taus[:, None])
+    basis[:, :, 2] = np.sqrt(t)[None, :]
     
-    print(f"[CSV] Removed previous entry for {serial_number}")
+    # Batched least squares (pinv also copes with near-collinear columns)
+    coeffs = np.linalg.pinv(basis) @ v
+    residuals = np.sum(((basis @ coeffs[:, :, None])[:, :, 0] - v) ** 2, axis=1)
+    best = int(np.argmin(residuals))
+    v0, step, diffusion = coeffs[best]
+    
+    return DcirFit(
+        r_ohm=float((v0 - v_idle) / current),
+        r_ct=float(step / current),
+        tau=float(taus[best]),
+        sigma=float(diffusion / current),
+    )
 
 
-def prompt_duplicate_action(serial_number: str, existing_data: dict) -> str:
+async def _measure_under_current(inst: Keithley2461, current: float,
+                                 voltage_limit: float,
+                                 dwell: float) -> VoltageReading:
     """
-    Prompt the user for action when a duplicate serial number is detected.
+    Source a DC current, wait, then measure the cell voltage.
+    
+    The output is switched on for the dwell and off again afterwards, even if
+    the measurement fails or the task is cancelled. Normally switching off
+    rides along with the reading query (see measure_voltage_then_off). The
+    dwell is awaited, so other coroutines (e.g. analysis of the previous
+    leg) can run while the cell settles.
     
     Args:
-        serial_number: The duplicate serial number
-        existing_data: The existing row data from the CSV
+        inst: Initialized Keithley2461 instance
+        current: Source current in amperes (0 for an idle measurement)
+        voltage_limit: Voltage compliance limit in volts
+        dwell: Time to hold the current before measuring, in seconds
         
     Returns:
-        User's choice: 'retest', 'skip', or 'rename'
+        VoltageReading with the measured voltage, timestamped as soon as the
+        reading came back
     """
-    print("\n" + "-" * 60)
-    print(f"DUPLICATE DETECTED: {serial_number}")
-    print("-" * 60)
-    print("\nThis cell already has test results in the output file:")
-    print(f"  OCV  : {float(existing_data.get('OCV (V)', 0)):.4f} V")
-    print(f"  R0   : {float(existing_data.get('R0 (Ohm)', 0))*1000:.2f} mΩ")
-    print(f"  DCIR : {float(existing_data.get('DCIR (Ohm)', 0))*1000:.2f} mΩ")
-    print("\nOptions:")
-    print("  [R] Retest - Test it again! This will OVERWRITE the previous results")
-    print("  [S] Skip   - Cancel and enter a different serial number")
-    print("  [N] New    - This is a DIFFERENT cell, enter a new serial number")
-    
-    while True:
-        choice = input("\nYour choice (R/S/N): ").strip().upper()
-        
-        if choice in ('R', 'RETEST'):
-            return 'retest'
-        elif choice in ('S', 'SKIP'):
-            return 'skip'
-        elif choice in ('N', 'NEW'):
-            return 'rename'
-        else:
-            print("  Invalid choice. Please enter R, S, or N.")
-
+    inst.arm_and_enable(current, voltage_limit)
+    try:
+        await asyncio.sleep(dwell)
+        voltage = inst.measure_voltage_then_off()
+        return VoltageReading(voltage, time.monotonic())
+    except BaseException:
+        inst.output_off()
+        raise
 
-# =============================================================================
-# Individual Test Functions
-# =============================================================================
 
-def test_ocv(inst: Keithley2461) -> float:
+async def test_ocv(inst: Keithley2461) -> VoltageReading:
     """
     Measure the Open Circuit Voltage (OCV) of the cell.
     
@@ -587,20 +1995,19 @@ def test_ocv(inst: Keithley2461) -> float:
         inst: Initialized Keithley2461 instance
         
     Returns:
-        Open circuit voltage in volts
+        VoltageReading with the open circuit voltage in volts and the time it
+        was read (so it can be reused as R0's idle voltage while fresh)
     """
-    print("\n  [TEST 1/3] Open Circuit Voltage (OCV)")
-    print("  " + "-" * 40)
-    
-    # Configure for zero-current voltage measurement
-    inst.source_current(0.0, kChargeComplianceLimit_volts)
-    inst.output_on()
+    print("\n".join([
+        "\n  [TEST 1/3] Open Circuit Voltage (OCV)",
+        "  " + "-" * 40,
+    ]))
     
-    # Allow settling time for stable reading
-    time.sleep(kVoltageSenseDwell_seconds)
-    
-    ocv = inst.measure_voltage()
-    inst.output_off()
+    # Zero-current voltage measurement, after a settling time
+    reading = await _measure_under_current(
+        inst, 0.0, kChargeComplianceLimit_volts, kVoltageSenseDwell_seconds
+    )
+    ocv = reading.voltage
     
     print(f"  Result: OCV = {ocv:.4f} V")
     
@@ -608,10 +2015,11 @@ def test_ocv(inst: Keithley2461) -> float:
     if ocv < 2.0 or ocv > 4.5:
         print(f"  WARNING: OCV ({ocv:.2f}V) outside typical Li-ion range (2.0-4.5V)")
     
-    return ocv
+    return reading
 
 
-def test_r0(inst: Keithley2461) -> dict:
+async def test_r0(inst: Keithley2461,
+                  idle_reading: VoltageReading | None = None) -> R0Result:
     """
     Measure instantaneous resistance (R0) via pulse testing.
     
@@ -627,55 +2035,83 @@ def test_r0(inst: Keithley2461) -> dict:
         4. Repeat for both charge and discharge directions
         5. Average the two values for R0 estimate
     
+    The same pulses also give an instantaneous R0, using the voltage
+    extrapolated to the start of the pulse (see pulse_onset_voltage) in
+    place of the plateau voltage.
+    
+    The charge-direction idle voltage is measured under the same conditions
+    as the OCV (zero current, charge compliance limit), so a recent OCV can
+    be passed in and reused instead of settling and measuring again.
+    
     Args:
         inst: Initialized Keithley2461 instance
+        idle_reading: Optional zero-current VoltageReading (e.g. from
+            test_ocv) to use as the pre-charge V_idle. Ignored if older than
+            kIdleReuseMaxAge_seconds.
         
     Returns:
-        Dictionary containing:
-            - r0: Average R0 (charge + discharge) in ohms
-            - r0_charge: Charging direction R0 in ohms
-            - r0_discharge: Discharging direction R0 in ohms
+        R0Result with the per-direction and averaged resistances
     """
-    print(f"\n  [TEST 2/3] Instantaneous Resistance (R0)")
-    print("  " + "-" * 40)
-    print(f"  Parameters: {kR0PulseCurrent_amps}A pulse, {kR0PulseDuration_seconds*1000:.1f}ms width")
+    print("\n".join([
+        f"\n  [TEST 2/3] Instantaneous Resistance (R0)",
+        "  " + "-" * 40,
+        f"  Parameters: {kR0PulseCurrent_amps}A pulse, {kR0PulseDuration_seconds*1000:.1f}ms width",
+    ]))
     
     # --- Charge Direction ---
     print("  \n  Charge direction:")
     
-    # Measure idle voltage before charge pulse
-    inst.source_current(0.0, kChargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kVoltageSenseDwell_seconds)
-    v_idle_charge = inst.measure_voltage()
-    inst.output_off()
+    # Measure idle voltage before charge pulse, unless a fresh one was given
+    if (idle_reading is not None
+            and time.monotonic() - idle_reading.timestamp <= kIdleReuseMaxAge_seconds):
+        v_idle_charge = idle_reading.voltage
+    else:
+        v_idle_charge = (await _measure_under_current(
+            inst, 0.0, kChargeComplianceLimit_volts, kVoltageSenseDwell_seconds
+        )).voltage
     print(f"    V_idle (pre-charge)  = {v_idle_charge:.4f} V")
     
     # Execute charge pulse and capture voltage
-    v_load_charge = inst.source_pulse_current(
+    pulse_charge = inst.source_pulse_current(
         kR0PulseCurrent_amps, 
         kChargeComplianceLimit_volts, 
         kR0PulseDuration_seconds
     )
+    v_load_charge = pulse_charge.plateau_mean
     print(f"    V_load (during pulse) = {v_load_charge:.4f} V")
     
     # --- Discharge Direction ---
     print("  \n  Discharge direction:")
     
-    # Measure idle voltage before discharge pulse
-    inst.source_current(0.0, kDischargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kVoltageSenseDwell_seconds)
-    v_idle_discharge = inst.measure_voltage()
-    inst.output_off()
-    print(f"    V_idle (pre-discharge) = {v_idle_discharge:.4f} V")
+    if kR0ReuseIdleVoltage:
+        # Assume the cell is back at its pre-charge voltage after the short
+        # pulse and the pulse train's off time (10x the pulse width)
+        v_idle_discharge = v_idle_charge
+        v_onset_charge = pulse_onset_voltage(pulse_charge)
+        print(f"    V_idle (pre-discharge) = {v_idle_discharge:.4f} V (reused)")
+    else:
+        # Measure idle voltage before discharge pulse. The charge pulse's
+        # onset fit runs on a worker thread meanwhile, overlapping the
+        # settling time.
+        idle_discharge, v_onset_charge = await asyncio.gather(
+            _measure_under_current(
+                inst, 0.0, kDischargeComplianceLimit_volts,
+                kVoltageSenseDwell_seconds
+            ),
+            asyncio.get_running_loop().run_in_executor(
+                None, pulse_onset_voltage, pulse_charge
+            ),
+        )
+        v_idle_discharge = idle_discharge.voltage
+        print(f"    V_idle (pre-discharge) = {v_idle_discharge:.4f} V")
     
     # Execute discharge pulse and capture voltage
-    v_load_discharge = inst.source_pulse_current(
+    pulse_discharge = inst.source_pulse_current(
         -kR0PulseCurrent_amps,  # Negative for discharge
         kDischargeComplianceLimit_volts, 
         kR0PulseDuration_seconds
     )
+    v_load_discharge = pulse_discharge.plateau_mean
     print(f"    V_load (during pulse) = {v_load_discharge:.4f} V")
     
     # --- Calculate R0 ---
@@ -684,23 +2120,87 @@ def test_r0(inst: Keithley2461) -> dict:
     r_discharge = (v_idle_discharge - v_load_discharge) / kR0PulseCurrent_amps
     r0 = (r_charge + r_discharge) / 2.0
     
-    print(f"\n  Results:")
-    print(f"    R0 (charge)    = {r_charge*1000:.2f} mΩ")
-    print(f"    R0 (discharge) = {r_discharge*1000:.2f} mΩ")
-    print(f"    R0 (average)   = {r0*1000:.2f} mΩ")
+    # Instantaneous R0 from the voltage at the start of each pulse
+    r_inst_charge = (v_onset_charge - v_idle_charge) / kR0PulseCurrent_amps
+    r_inst_discharge = (
+        v_idle_discharge - pulse_onset_voltage(pulse_discharge)
+    ) / kR0PulseCurrent_amps
+    r0_instant = (r_inst_charge + r_inst_discharge) / 2.0
+    
+    print("\n".join([
+        f"\n  Results:",
+        f"    R0 (charge)    = {r_charge*1000:.2f} mΩ",
+        f"    R0 (discharge) = {r_discharge*1000:.2f} mΩ",
+        f"    R0 (average)   = {r0*1000:.2f} mΩ",
+        f"    R0 (instant)   = {r0_instant*1000:.2f} mΩ",
+    ]))
     
     # Validate R0 is within expected range for 21700 cells (~20-40mΩ)
     if r0 > 0.1:  # 100mΩ threshold
         print(f"  WARNING: R0 ({r0*1000:.1f}mΩ) seems high. Check cell contacts.")
     
-    return {
-        'r0': r0,
-        'r0_charge': r_charge,
-        'r0_discharge': r_discharge
-    }
+    return R0Result(
+        r0=r0,
+        r0_charge=r_charge,
+        r0_discharge=r_discharge,
+        r0_instant=r0_instant,
+        r0_instant_charge=r_inst_charge,
+        r0_instant_discharge=r_inst_discharge,
+    )
+
+
+async def _dcir_leg(inst: Keithley2461, current: float, voltage_limit: float,
+                    label: str) -> tuple[float, float, VoltageTrace]:
+    """
+    Run one direction of the DCIR test in a single output-on session.
+    
+    The idle voltage is read at zero current and the load current is then
+    applied without switching the output off in between, which saves the
+    SCPI round-trips and relay cycling of a separate idle measurement.
+    
+    During the load the instrument logs the voltage into its own buffer,
+    which is read back in one transfer at the end. V_load is the mean of
+    the final kDcirLoadAveragePoints readings. The readings' timestamps
+    start at the first reading, which lands after the current step by the
+    time taken to start the trace (timed on the host) plus the trigger
+    model's lead time (see start_voltage_trace). Their sum is recorded as
+    the trace's step_delay.
+    
+    Args:
+        inst: Initialized Keithley2461 instance
+        current: Load current in amperes (positive=charge, negative=discharge)
+        voltage_limit: Voltage compliance limit in volts
+        label: Direction name used in the log output ("charge"/"discharge")
+        
+    Returns:
+        Tuple of (idle voltage, voltage at end of load, load voltage trace)
+    """
+    inst.arm_and_enable(0.0, voltage_limit)
+    try:
+        await asyncio.sleep(kVoltageSenseDwell_seconds)
+        v_idle = inst.measure_voltage()
+        print(f"    V_idle (pre-{label}) = {v_idle:.4f} V")
+        
+        # Apply load current for specified duration
+        print(f"    Applying {current}A for {kDcirDuration_seconds}s...")
+        inst.source_current(current, voltage_limit)
+        step_time = time.monotonic()
+        lead_time = inst.start_voltage_trace(kDcirDuration_seconds,
+                                             kDcirTracePoints)
+        step_delay = time.monotonic() - step_time + lead_time
+        await asyncio.sleep(kDcirDuration_seconds)
+        trace = inst.fetch_voltage_trace()._replace(step_delay=step_delay)
+    finally:
+        inst.output_off()
+    
+    tail = trace.voltage[-kDcirLoadAveragePoints:]
+    v_load = float(sum(tail)) / len(tail)
+    print(f"    V_load (end of {label}) = {v_load:.4f} V")
+    
+    return v_idle, v_load, trace
 
 
-def test_dcir(inst: Keithley2461) -> dict:
+async def test_dcir(inst: Keithley2461) -> DcirResult:
     """
     Measure DC Internal Resistance (DCIR) via sustained current application.
     
@@ -715,134 +2215,148 @@ def test_dcir(inst: Keithley2461) -> dict:
     Method:
         1. Measure idle voltage
         2. Apply constant current for duration (e.g., 10 seconds)
-        3. Measure voltage under load
+        3. Log voltage under load; average the final readings
         4. Calculate R = ΔV / ΔI
         5. Repeat for charge and discharge directions
     
+    Steps 1-3 run with the output left on throughout (see _dcir_leg). The
+    logged voltage traces are also fitted to separate the ohmic,
+    charge-transfer and diffusion contributions.
+    
     Args:
         inst: Initialized Keithley2461 instance
         
     Returns:
-        Dictionary containing:
-            - dcir: Average DCIR (charge + discharge) in ohms
-            - dcir_charge: Charging direction DCIR in ohms
-            - dcir_discharge: Discharging direction DCIR in ohms
+        DcirResult with the resistances, averaged fit and both load traces
     """
-    print(f"\n  [TEST 3/3] DC Internal Resistance (DCIR)")
-    print("  " + "-" * 40)
-    print(f"  Parameters: {kDcirCurrent_amps}A for {kDcirDuration_seconds}s")
+    print("\n".join([
+        f"\n  [TEST 3/3] DC Internal Resistance (DCIR)",
+        "  " + "-" * 40,
+        f"  Parameters: {kDcirCurrent_amps}A for {kDcirDuration_seconds}s",
+    ]))
     
     # --- Charge Direction ---
     print("\n  Charge direction:")
-    
-    # Measure idle voltage before charge
-    inst.source_current(0.0, kChargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kVoltageSenseDwell_seconds)
-    v_idle_charge = inst.measure_voltage()
-    inst.output_off()
-    print(f"    V_idle (pre-charge) = {v_idle_charge:.4f} V")
-    
-    # Apply charge current for specified duration
-    print(f"    Applying {kDcirCurrent_amps}A for {kDcirDuration_seconds}s...")
-    inst.source_current(kDcirCurrent_amps, kChargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kDcirDuration_seconds)
-    v_load_charge = inst.measure_voltage()
-    inst.output_off()
-    print(f"    V_load (end of charge) = {v_load_charge:.4f} V")
+    v_idle_charge, v_load_charge, trace_charge = await _dcir_leg(
+        inst, kDcirCurrent_amps, kChargeComplianceLimit_volts, "charge"
+    )
     
     # --- Discharge Direction ---
     print("\n  Discharge direction:")
-    
-    # Measure idle voltage before discharge
-    inst.source_current(0.0, kDischargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kVoltageSenseDwell_seconds)
-    v_idle_discharge = inst.measure_voltage()
-    inst.output_off()
-    print(f"    V_idle (pre-discharge) = {v_idle_discharge:.4f} V")
-    
-    # Apply discharge current for specified duration
-    print(f"    Applying {-kDcirCurrent_amps}A for {kDcirDuration_seconds}s...")
-    inst.source_current(-kDcirCurrent_amps, kDischargeComplianceLimit_volts)
-    inst.output_on()
-    time.sleep(kDcirDuration_seconds)
-    v_load_discharge = inst.measure_voltage()
-    inst.output_off()
-    print(f"    V_load (end of discharge) = {v_load_discharge:.4f} V")
+    v_idle_discharge, v_load_discharge, trace_discharge = await _dcir_leg(
+        inst, -kDcirCurrent_amps, kDischargeComplianceLimit_volts, "discharge"
+    )
     
     # --- Calculate DCIR ---
     r_charge = (v_load_charge - v_idle_charge) / kDcirCurrent_amps
     r_discharge = (v_idle_discharge - v_load_discharge) / kDcirCurrent_amps
     dcir = (r_charge + r_discharge) / 2.0
     
-    print(f"\n  Results:")
-    print(f"    DCIR (charge)    = {r_charge*1000:.2f} mΩ")
-    print(f"    DCIR (discharge) = {r_discharge*1000:.2f} mΩ")
-    print(f"    DCIR (average)   = {dcir*1000:.2f} mΩ")
+    # --- Decompose the load response (averaged over both directions) ---
+    fit_charge = analyze_dcir_trace(trace_charge, v_idle_charge, kDcirCurrent_amps)
+    fit_discharge = analyze_dcir_trace(
+        trace_discharge, v_idle_discharge, -kDcirCurrent_amps
+    )
+    fit = DcirFit(*((a + b) / 2.0 for a, b in zip(fit_charge, fit_discharge)))
+    
+    print("\n".join([
+        f"\n  Results:",
+        f"    DCIR (charge)    = {r_charge*1000:.2f} mΩ",
+        f"    DCIR (discharge) = {r_discharge*1000:.2f} mΩ",
+        f"    DCIR (average)   = {dcir*1000:.2f} mΩ",
+        f"    Fit: R_ohm = {fit.r_ohm*1000:.2f} mΩ, "
+        f"R_ct = {fit.r_ct*1000:.2f} mΩ, tau = {fit.tau:.2f} s, "
+        f"sigma = {fit.sigma*1000:.2f} mΩ/√s",
+    ]))
     
-    return {
-        'dcir': dcir,
-        'dcir_charge': r_charge,
-        'dcir_discharge': r_discharge
-    }
+    return DcirResult(
+        dcir=dcir,
+        dcir_charge=r_charge,
+        dcir_discharge=r_discharge,
+        fit=fit,
+        trace_charge=trace_charge,
+        trace_discharge=trace_discharge,
+    )
 
 
-def run_tests(inst: Keithley2461, serial_number: str) -> dict:
+async def run_tests(inst: Keithley2461, serial_number: str) -> CellResult:
     """
     Execute the complete battery cell test sequence.
     
     Runs all three tests (OCV, R0, DCIR) in sequence and aggregates results
-    into a dictionary suitable for CSV logging.
+    into a CellResult (see CellResult.as_row for the CSV row).
     
     Args:
         inst: Initialized Keithley2461 instance
         serial_number: Cell identification string (e.g., barcode)
         
     Returns:
-        Dictionary with all test results, keyed for CSV fieldnames
+        CellResult with all test results
     """
-    print("\n" + "=" * 60)
-    print(f"CELL TEST: {serial_number}")
-    print("=" * 60)
+    print("\n".join([
+        "\n" + "=" * 60,
+        f"CELL TEST: {serial_number}",
+        "=" * 60,
+    ]))
     
     # Execute test sequence
-    ocv = test_ocv(inst)
-    r0_results = test_r0(inst)
-    dcir_results = test_dcir(inst)
+    ocv_reading = await test_ocv(inst)
+    ocv = ocv_reading.voltage
+    # The OCV doubles as R0's pre-charge idle voltage (same conditions)
+    r0_result = await test_r0(inst, idle_reading=ocv_reading)
+    dcir_result = await test_dcir(inst)
     
     # Aggregate results
-    results = {
-        "Serial Number": serial_number,
-        "OCV (V)": ocv,
-        "R0 (Ohm)": r0_results['r0'],
-        "R0 Charge (Ohm)": r0_results['r0_charge'],
-        "R0 Discharge (Ohm)": r0_results['r0_discharge'],
-        "DCIR (Ohm)": dcir_results['dcir'],
-        "DCIR Charge (Ohm)": dcir_results['dcir_charge'],
-        "DCIR Discharge (Ohm)": dcir_results['dcir_discharge']
-    }
+    results = CellResult(serial_number, ocv, r0_result, dcir_result)
     
     # Print summary
-    print("\n" + "=" * 60)
-    print("TEST SUMMARY")
-    print("=" * 60)
-    print(f"  Serial Number : {serial_number}")
-    print(f"  OCV           : {ocv:.4f} V")
-    print(f"  R0            : {r0_results['r0']*1000:.2f} mΩ")
-    print(f"  DCIR          : {dcir_results['dcir']*1000:.2f} mΩ")
-    print("=" * 60 + "\n")
+    print("\n".join([
+        "\n" + "=" * 60,
+        "TEST SUMMARY",
+        "=" * 60,
+        f"  Serial Number : {serial_number}",
+        f"  OCV           : {ocv:.4f} V",
+        f"  R0            : {r0_result.r0*1000:.2f} mΩ",
+        f"  DCIR          : {dcir_result.dcir*1000:.2f} mΩ",
+        "=" * 60 + "\n",
+    ]))
     
     return results
 
 
-def main():
+async def poll_instrument_health(inst: Keithley2461,
+                                 interval: float = kHealthPollInterval_seconds):
     """
-    Main entry point for the battery cell testing script.
+    Periodically check the instrument responds, reporting changes.
     
-    Parses command-line arguments, initializes the instrument, and runs an
-    interactive loop prompting for cell serial numbers and executing tests.
+    Meant to run as a background task only while the script is idle (waiting
+    for the operator), so it never interleaves with a test's SCPI traffic.
+    Prints a warning when the instrument stops responding and a notice when
+    it comes back, so a disconnect is noticed before the next cell is scanned.
+    
+    Args:
+        inst: Initialized Keithley2461 instance
+        interval: Seconds between checks
+    """
+    responsive = True
+    while True:
+        await asyncio.sleep(interval)
+        if inst.is_responsive() != responsive:
+            responsive = not responsive
+            if responsive:
+                print("\n[INFO] Instrument is responding again.")
+            else:
+                print("\n[WARNING] Instrument is not responding. "
+                      "Check USB cable and power before testing.")
+
+
+@functools.lru_cache(maxsize=None)
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command-line parser (once; later calls return the same one).
+    
+    Returns:
+        ArgumentParser for the script's command-line options
     """
     parser = argparse.ArgumentParser(
         description="Battery Cell Testing Script for Keithley 2461",
@@ -852,6 +2366,7 @@ def main():
             python test_cells.py output.csv                    # Basic usage
             python test_cells.py output.csv --mock             # Test without hardware
             python test_cells.py output.csv --test-connection  # Verify instrument connection
+            python test_cells.py output.csv --trace-dir traces # Save DCIR voltage traces
         """
     )
     parser.add_argument(
@@ -868,38 +2383,63 @@ def main():
         action="store_true", 
         help="Run in mock mode without hardware (for testing/development)"
     )
+    parser.add_argument(
+        "--trace-dir",
+        help="Directory to save each cell's DCIR voltage traces in (optional)"
+    )
     parser.add_argument(
         "--test-connection", 
         action="store_true",
         help="Test instrument connection and exit"
     )
-    args = parser.parse_args()
-
-    # Define CSV column structure
-    fieldnames = [
-        "Serial Number", 
-        "OCV (V)", 
-        "R0 (Ohm)", 
-        "R0 Charge (Ohm)", 
-        "R0 Discharge (Ohm)", 
-        "DCIR (Ohm)", 
-        "DCIR Charge (Ohm)", 
-        "DCIR Discharge (Ohm)"
-    ]
-    
-    # Create CSV file with header if it doesn't exist
-    try:
-        with open(args.output_csv, 'x', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            print(f"[CSV] Created new output file: {args.output_csv}")
-    except FileExistsError:
-        print(f"[CSV] Appending to existing file: {args.output_csv}")
+    return parser
+
+
+async def amain():
+    """
+    Main entry point for the battery cell testing script.
+    
+    Parses command-line arguments, initializes the instrument, and runs an
+    interactive loop prompting for cell serial numbers and executing tests.
+    Runs as a coroutine so settling and load delays (and waiting on the
+    operator) don't block the event loop.
+    """
+    args = build_parser().parse_args()
+    _import_numpy()
+
+    # Only real hardware needs PyVISA; --mock runs without it installed
+    visa_errors = () if args.mock else (_import_pyvisa().errors.VisaIOError,)
+
+    if args.trace_dir is not None:
+        os.makedirs(args.trace_dir, exist_ok=True)
+
+    # Create or upgrade the output file on a worker thread while the
+    # instrument connects and resets; both mostly wait on I/O
+    csv_ready = asyncio.get_running_loop().run_in_executor(
+        None, prepare_output_csv, args.output_csv
+    )
+    csvfile = None
 
     # Initialize instrument
     inst = None
     try:
-        inst = Keithley2461(args.resource, mock=args.mock)
+        try:
+            inst = make_smu(args.resource, mock=args.mock)
+        except BaseException:
+            # Retrieve the file preparation's outcome once it finishes, so a
+            # failure there isn't reported as never retrieved
+            csv_ready.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+        
+        try:
+            print("\n".join(await csv_ready))
+        except ValueError as e:
+            print(f"\n[ERROR] {e}")
+            sys.exit(1)
+        
+        # Keep one line-buffered handle open for the whole session
+        csvfile = open(args.output_csv, 'a', newline='', encoding='utf-8',
+                       buffering=1)
         
         # Handle connection test mode
         if args.test_connection:
@@ -907,15 +2447,22 @@ def main():
             sys.exit(0 if success else 1)
 
         # Main testing loop
-        print("\n" + "=" * 60)
-        print("BATTERY CELL TESTING READY")
-        print("=" * 60)
-        print("Scan a cell barcode or type serial number to begin.")
-        print("Type 'q' or press Ctrl+C to quit.\n")
+        print("\n".join([
+            "\n" + "=" * 60,
+            "BATTERY CELL TESTING READY",
+            "=" * 60,
+            "Scan a cell barcode or type serial number to begin.",
+            "Type 'q' or press Ctrl+C to quit.\n",
+        ]))
         
         while True:
             try:
-                serial_number = input("Cell serial number: ").strip()
+                # Watch for disconnects while the operator is scanning
+                health = asyncio.ensure_future(poll_instrument_health(inst))
+                try:
+                    serial_number = (await ainput("Cell serial number: ")).strip()
+                finally:
+                    health.cancel()
                 
                 if serial_number.lower() == 'q':
                     print("\nExiting...")
@@ -929,14 +2476,14 @@ def main():
                 existing_data = check_duplicate_serial(args.output_csv, serial_number)
                 
                 if existing_data is not None:
-                    action = prompt_duplicate_action(serial_number, existing_data)
+                    action = await prompt_duplicate_action(serial_number, existing_data)
                     
                     if action == 'skip':
                         print("\n[SKIP] Test cancelled. Enter a new serial number.\n")
                         continue
                     elif action == 'rename':
                         # Prompt for a new serial number instead
-                        new_serial = input("\nEnter the correct serial number: ").strip()
+                        new_serial = (await ainput("\nEnter the correct serial number: ")).strip()
                         if not new_serial or new_serial.lower() == 'q':
                             print("\n[SKIP] Test cancelled.\n")
                             continue
@@ -946,41 +2493,54 @@ def main():
                         existing_data = check_duplicate_serial(args.output_csv, serial_number)
                         if existing_data is not None:
                             print(f"\n[WARNING] '{serial_number}' also exists in the file!")
-                            action = prompt_duplicate_action(serial_number, existing_data)
+                            action = await prompt_duplicate_action(serial_number, existing_data)
                             if action == 'skip' or action == 'rename':
                                 print("\n[SKIP] Test cancelled. Please start over.\n")
                                 continue
                             # action == 'retest' falls through to remove and test
                             
                     if action == 'retest' or (action == 'rename' and existing_data):
-                        # Remove the old entry before retesting
-                        remove_serial_from_csv(args.output_csv, serial_number, fieldnames)
+                        # Retire the old entry before retesting
+                        mark_serial_superseded(csvfile, serial_number)
 
                 # Run test sequence
-                results = run_tests(inst, serial_number)
+                results = await run_tests(inst, serial_number)
                 
-                # Append results to CSV
-                with open(args.output_csv, 'a', newline='') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writerow(results)
+                # Append results to CSV, then the (optional) traces
+                append_row(csvfile, {**results.as_row(), "Status": STATUS_ACTIVE})
+                if args.trace_dir is not None:
+                    save_dcir_traces(args.trace_dir, serial_number, results.dcir)
                 
                 print(f"[CSV] Results saved for {serial_number}")
                 inst.beep_success()
                 
-            except KeyboardInterrupt:
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                # asyncio.run turns Ctrl+C into cancellation of this task
                 print("\n\nInterrupted by user. Exiting...")
                 break
+            except EOFError:
+                # stdin closed (end of a piped or redirected scan list)
+                print("\n\nEnd of input. Exiting...")
+                break
             except Exception as e:
                 print(f"\n[ERROR] Test failed for cell: {e}")
                 print("        Check connections and try again.\n")
-
-    except pyvisa.errors.VisaIOError as e:
-        print(f"\n[ERROR] Failed to connect to instrument: {e}")
-        print("\nTroubleshooting steps:")
-        print("  1. Verify USB cable is connected")
-        print("  2. Check instrument is powered on")
-        print("  3. Verify RESOURCE_NAME constant matches your instrument")
-        print("  4. Run: python -c \"import pyvisa; print(pyvisa.ResourceManager('@py').list_resources())\"")
+                # A failed write may have left the instrument in a different
+                # state from the one cached, so start the next cell from *RST
+                try:
+                    inst.reset()
+                except Exception as reset_error:
+                    print(f"[WARNING] Instrument reset failed: {reset_error}")
+
+    except visa_errors as e:
+        print("\n".join([
+            f"\n[ERROR] Failed to connect to instrument: {e}",
+            "\nTroubleshooting steps:",
+            "  1. Verify USB cable is connected",
+            "  2. Check instrument is powered on",
+            "  3. Verify RESOURCE_NAME constant matches your instrument",
+            "  4. Run: python -c \"import pyvisa; print(pyvisa.ResourceManager('@py').list_resources())\"",
+        ]))
         sys.exit(1)
     except Exception as e:
         print(f"\n[ERROR] Unexpected error: {e}")
@@ -988,7 +2548,15 @@ def main():
     finally:
         if inst is not None:
             inst.close()
+        if csvfile is not None:
+            csvfile.close()
 
 
 if __name__ == "__main__":
-    main()
+    console = QueuedStdout(sys.stdout)
+    sys.stdout = console
+    try:
+        asyncio.run(amain())
+    finally:
+        sys.stdout = console.stream
+        console.close()